@@ -3,7 +3,7 @@ from django.contrib.admin import ModelAdmin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import gettext_lazy as _
 
-from book.models import User, Book, Author, Genre, Basket, Rental
+from book.models import User, Book, Author, Genre, Basket, Rental, RentalArchive, UserBalance
 
 
 @admin.register(User)
@@ -69,3 +69,14 @@ class RentalAdmin(ModelAdmin):
     list_display = ['id','user', 'book', 'start_date', 'end_date', 'penalty', 'status']
     search_fields = ['status']
     search_help_text = "Status bo'yicha qidirish"
+
+
+@admin.register(RentalArchive)
+class RentalArchiveAdmin(ModelAdmin):
+    list_display = ['id', 'user', 'book', 'start_date', 'end_date', 'penalty', 'status', 'archived_at']
+    list_select_related = ['user', 'book']
+
+
+@admin.register(UserBalance)
+class UserBalanceAdmin(ModelAdmin):
+    list_display = ['user', 'debt', 'active_rentals', 'updated_at']
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class BookConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'book'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+
+        from book.authentication import token_deleted, user_changed
+        from book.cache import catalog_deleted
+        from book.search import book_deleted, create_index
+
+        post_migrate.connect(create_index, sender=self)
+        post_save.connect(user_changed, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(user_changed, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(token_deleted, sender=Token)
+        for model in ('Book', 'Author', 'Genre'):
+            post_delete.connect(catalog_deleted, sender=self.get_model(model))
+        post_delete.connect(book_deleted, sender=self.get_model('Book'))
@@ -0,0 +1,128 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+
+from book import search
+from book.authentication import CachedTokenAuthentication
+from book.cache import aget_or_compute, aget_versions
+from book.models import Author, Book, Genre
+from book.normalize import normalize_name
+from book.serializer import BookSerializer, GenreSerializer
+
+
+async def get_user(request):
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Token '):
+        try:
+            user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(header[6:].strip())
+        except AuthenticationFailed:
+            return None
+        return user
+    # Session authentication: the lazy request.user does blocking ORM work, so resolve it in a thread.
+    return await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+
+
+def login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await get_user(request)
+        if user is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+async def keyset_page(request, queryset):
+    # ?after=<id> keyset pagination, the async counterpart of IdCursorPagination.
+    try:
+        after = int(request.GET.get('after', 0))
+        size = int(request.GET.get('page_size', settings.REST_FRAMEWORK['PAGE_SIZE']))
+    except ValueError:
+        after, size = 0, settings.REST_FRAMEWORK['PAGE_SIZE']
+    size = max(1, min(size, 500))
+    rows = [row async for row in queryset.filter(id__gt=after).order_by('id')[:size + 1]]
+    next_url = None
+    if len(rows) > size:
+        rows = rows[:size]
+        query = request.GET.copy()
+        query['after'] = rows[-1].id
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+    return rows, next_url
+
+
+def books_queryset():
+    return Book.objects.select_related('author', 'genre')
+
+
+@login_required
+async def book_list(request):
+    books, next_url = await keyset_page(request, books_queryset())
+    return JsonResponse({'next': next_url, 'results': BookSerializer(books, many=True).data})
+
+
+@login_required
+async def book_detail(request, pk):
+    try:
+        book = await books_queryset().aget(pk=pk)
+    except Book.DoesNotExist:
+        raise Http404
+    return JsonResponse(BookSerializer(book).data)
+
+
+@login_required
+async def genre_list(request):
+    genres, next_url = await keyset_page(request, Genre.objects.all())
+    return JsonResponse({'next': next_url, 'results': GenreSerializer(genres, many=True).data})
+
+
+async def related_books(request, model, pk, field):
+    try:
+        instance = await model.objects.aget(pk=pk)
+    except model.DoesNotExist:
+        raise Http404
+    books, next_url = await keyset_page(request, books_queryset().filter(**{field: instance}))
+    return JsonResponse({'name': instance.name, 'books': BookSerializer(books, many=True).data, 'next': next_url})
+
+
+@login_required
+async def genre_books(request, pk):
+    return await related_books(request, Genre, pk, 'genre')
+
+
+@login_required
+async def author_books(request, pk):
+    return await related_books(request, Author, pk, 'author')
+
+
+async def search_books(cleaned_query):
+    if search.is_enabled():
+        book_ids = await sync_to_async(search.search_book_ids)(cleaned_query)
+        ranks = {book_id: rank for rank, book_id in enumerate(book_ids)}
+        books = sorted([book async for book in books_queryset().filter(pk__in=book_ids)],
+                       key=lambda book: ranks[book.pk])
+    else:
+        books = [book async for book in books_queryset().filter(search.fallback_filter(cleaned_query)).order_by('id')]
+    return BookSerializer(books, many=True).data
+
+
+@login_required
+async def book_search(request):
+    query = request.GET.get('search')
+    if not query:
+        return JsonResponse({"error": "Biror nom kiriting"}, status=400)
+
+    cleaned_query = normalize_name(query)
+    book_version, author_version, genre_version = await aget_versions('book', 'author', 'genre')
+    # Same key as SearchAPIView, so the sync and async paths share cached results.
+    cache_key = f"book_search_{book_version}.{author_version}.{genre_version}_{cleaned_query}"
+    result = await aget_or_compute(
+        cache_key,
+        lambda: search_books(cleaned_query),
+        timeout=settings.BOOK_SEARCH_CACHE_TTL,
+        empty_timeout=settings.BOOK_SEARCH_EMPTY_CACHE_TTL,
+    )
+    return JsonResponse(result, safe=False)
@@ -0,0 +1,162 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+MISSING = object()
+
+
+class LocalCache:
+    """Per-process LRU in front of Redis; entries expire after `ttl` seconds so other processes' invalidations apply."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalCache(settings.AUTH_LOCAL_CACHE_SIZE, settings.AUTH_LOCAL_CACHE_TTL)
+
+
+def token_key(key):
+    return f"auth_token_{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def user_key(user_id):
+    return f"auth_user_{user_id}"
+
+
+def cache_get(key):
+    value = local_cache.get(key, MISSING)
+    if value is MISSING:
+        value = cache.get(key, MISSING)
+        if value is not MISSING:
+            local_cache.set(key, value)
+    return value
+
+
+def cache_set(key, value):
+    cache.set(key, value, settings.AUTH_CACHE_TTL)
+    local_cache.set(key, value)
+
+
+def invalidate(*keys):
+    # After commit, so a concurrent request cannot cache the old row again.
+    def delete():
+        cache.delete_many(keys)
+        local_cache.delete_many(keys)
+
+    transaction.on_commit(delete)
+
+
+def cached_fields(model):
+    # Everything request.user reads, but not the password hash: that never goes into the shared cache.
+    return [field.attname for field in model._meta.concrete_fields if field.attname != 'password']
+
+
+def cache_user(user):
+    values = {name: getattr(user, name) for name in cached_fields(type(user))}
+    # Sessions are checked against this HMAC of the password hash, so it is kept in its place.
+    values['session_auth_hash'] = user.get_session_auth_hash()
+    cache_set(user_key(user.pk), values)
+
+
+def cached_user(values):
+    model = get_user_model()
+    names = cached_fields(model)
+    # Built like a queryset row with the password deferred, so save() never writes it back empty.
+    user = model.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+    session_auth_hash = values['session_auth_hash']
+    user.get_session_auth_hash = lambda: session_auth_hash
+    return user
+
+
+def get_cached_user(user_id):
+    values = cache_get(user_key(user_id))
+    if values is MISSING:
+        user = get_user_model().objects.filter(pk=user_id).first()
+        if user is not None:
+            cache_user(user)
+        return user
+    # A new instance per request: local entries are shared between threads.
+    return cached_user(values)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that resolves token -> user without SQL once both are cached."""
+
+    def authenticate_credentials(self, key):
+        user_id = cache_get(token_key(key))
+        user = get_cached_user(user_id) if user_id is not MISSING else None
+        if user is None:
+            token = Token.objects.select_related('user').filter(key=key).first()
+            if token is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            user = token.user
+            cache_set(token_key(key), user.pk)
+            cache_user(user)
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
+
+
+class CachedModelBackend(ModelBackend):
+    """Session authentication looks the user up by id on every request; serve it from the same cache."""
+
+    def get_user(self, user_id):
+        user = get_cached_user(user_id)
+        return user if self.user_can_authenticate(user) else None
+
+
+def user_changed(sender, instance, **kwargs):
+    # Any save may change role, is_active or the password (which invalidates sessions).
+    invalidate(user_key(instance.pk))
+
+
+def users_changed(user_ids):
+    # For queryset updates, which send no post_save.
+    invalidate(*[user_key(user_id) for user_id in user_ids])
+
+
+def token_deleted(sender, instance, **kwargs):
+    invalidate(token_key(instance.key))
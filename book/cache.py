@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from book.metrics import record_cache
+
+
+def _version_key(name):
+    return f"version_{name}"
+
+
+def get_versions(*names):
+    # Versions start from the current time in ms, so a counter evicted from the cache
+    # and re-created never reuses a number an older cached value was stored under.
+    keys = [_version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_versions(*names):
+    def bump():
+        for name in names:
+            try:
+                cache.incr(_version_key(name))
+            except ValueError:
+                cache.add(_version_key(name), int(time.time() * 1000), timeout=None)
+
+    # Readers must not see the new version before the write itself is visible.
+    transaction.on_commit(bump)
+
+
+def catalog_deleted(sender, **kwargs):
+    # post_delete receiver for Book, Author and Genre; their save() bumps the same counter.
+    bump_versions(sender._meta.model_name)
+
+
+def incr_counter(name):
+    key = f"counter_{name}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_counters(prefix, names):
+    keys = {f"counter_{prefix}_{name}": name for name in names}
+    values = cache.get_many(keys)
+    return {name: values.get(key, 0) for key, name in keys.items()}
+
+
+def get_or_compute(key, compute, timeout, empty_timeout, counter):
+    """Cache ``compute()`` under ``key``; concurrent misses wait for a single recomputation."""
+    started = time.perf_counter()
+    value = cache.get(key)
+    record_cache(value is not None, time.perf_counter() - started)
+    if value is not None:
+        incr_counter(f"{counter}_hit")
+        return value
+    incr_counter(f"{counter}_miss")
+
+    lock_key = f"{key}_lock"
+    deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+    while not cache.add(lock_key, 1, timeout=settings.CACHE_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            # The lock holder is too slow; compute without caching rather than fail.
+            return compute()
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+    try:
+        value = compute()
+        incr_counter(f"{counter}_recompute")
+        cache.set(key, value, timeout=timeout if value else empty_timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+async def aget_versions(*names):
+    keys = [_version_key(name) for name in names]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, int(time.time() * 1000), timeout=None)
+            versions[key] = await cache.aget(key)
+    return tuple(versions[key] for key in keys)
+
+
+async def aget_or_compute(key, compute, timeout, empty_timeout):
+    """Async counterpart of get_or_compute; ``compute`` is a coroutine function."""
+    value = await cache.aget(key)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}_lock"
+    deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+    while not await cache.aadd(lock_key, 1, timeout=settings.CACHE_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return await compute()
+        await asyncio.sleep(0.05)
+        value = await cache.aget(key)
+        if value is not None:
+            return value
+
+    try:
+        value = await compute()
+        await cache.aset(key, value, timeout=timeout if value else empty_timeout)
+    finally:
+        await cache.adelete(lock_key)
+    return value
@@ -0,0 +1,40 @@
+import csv
+import logging
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FIELDS = ('id', 'name', 'description', 'author', 'genre', 'daily_price', 'available_copies',
+                 'is_available', 'updated_at')
+
+
+class Echo:
+    """File-like object that hands each written line straight back to the csv writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for *values, updated_at in rows:
+        yield writer.writerow((*values, updated_at.isoformat()))
+
+
+def measured(rows):
+    started = time.monotonic()
+    count = 0
+    for row in rows:
+        count += 1
+        yield row
+    elapsed = time.monotonic() - started
+    logger.info("Exported %s books in %.2fs (%.0f rows/s)", count, elapsed, count / elapsed if elapsed else count)
@@ -0,0 +1,181 @@
+import csv
+import io
+import json
+import re
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+
+from book import search
+from book.cache import bump_versions
+from book.models import Author, Book, Genre
+from book.normalize import normalize_name
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ('name', 'author', 'genre', 'daily_price', 'available_copies')
+# text_stream() keeps bytes that are not UTF-8 as lone surrogates, so they can be reported per row.
+UNDECODABLE = re.compile('[\udc80-\udcff]')
+# Bulk inserts skip field validation, so prices are checked against the column here.
+PRICE_FIELD = Book._meta.get_field('daily_price')
+PRICE_STEP = Decimal(1).scaleb(-PRICE_FIELD.decimal_places)
+PRICE_LIMIT = 10 ** (PRICE_FIELD.max_digits - PRICE_FIELD.decimal_places)
+
+
+class CatalogImportError(Exception):
+    def __init__(self, message, resume_from):
+        super().__init__(message)
+        # Number of rows already committed; pass it back as ``skip`` to resume.
+        self.resume_from = resume_from
+
+
+class InvalidRow:
+    """Stands in for a record that could not be decoded; import_chunk reports it like a validation error."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def text_stream(binary):
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', errors='surrogateescape', newline='')
+
+
+def read_rows(stream, import_type):
+    """Yields one dict (or InvalidRow) per record of a text stream without loading the whole file."""
+    if import_type == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                yield next(reader)
+            except StopIteration:
+                return
+            except csv.Error as exc:
+                yield InvalidRow(f"Invalid CSV: {exc}")
+    elif import_type == 'jsonl':
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield InvalidRow(f"Invalid JSON: {exc}")
+                continue
+            yield row if isinstance(row, dict) else InvalidRow("Expected a JSON object")
+    else:
+        raise ValueError(f"Unknown import type: {import_type}")
+
+
+class CatalogImporter:
+    def __init__(self, chunk_size=5000, progress=None):
+        self.chunk_size = chunk_size
+        self.progress = progress or (lambda **stats: None)
+        # cleaned_name -> id caches, shared across chunks
+        self.authors = {}
+        self.genres = {}
+
+    def run(self, rows, skip=0):
+        started = time.monotonic()
+        stats = {'rows': 0, 'imported': 0, 'skipped': 0, 'errors': []}
+        rows = islice(rows, skip, None)
+        position = skip
+        while True:
+            chunk_started = time.monotonic()
+            try:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                imported, errors = self.import_chunk(chunk, first_row=position + 1)
+            except Exception as exc:
+                logger.exception("Import failed in the chunk starting at row %s", position + 1)
+                raise CatalogImportError(str(exc), resume_from=position) from exc
+
+            position += len(chunk)
+            stats['rows'] += len(chunk)
+            stats['imported'] += imported
+            stats['skipped'] += len(errors)
+            stats['errors'] += errors[:100 - len(stats['errors'])]
+            elapsed = time.monotonic() - started
+            self.progress(rows=position, imported=stats['imported'], chunk_rows=len(chunk),
+                          chunk_seconds=time.monotonic() - chunk_started,
+                          rows_per_second=stats['rows'] / elapsed if elapsed else 0)
+
+        stats['elapsed'] = round(time.monotonic() - started, 3)
+        if stats['imported']:
+            bump_versions('book', 'author', 'genre')
+        return stats
+
+    def import_chunk(self, chunk, first_row):
+        books, errors, valid = [], [], []
+        for number, row in enumerate(chunk, start=first_row):
+            if isinstance(row, InvalidRow):
+                errors.append({'row': number, 'error': row.error})
+                continue
+            if any(UNDECODABLE.search(str(value)) for value in row.values()):
+                errors.append({'row': number, 'error': "Not valid UTF-8"})
+                continue
+            missing = [field for field in REQUIRED_FIELDS if not str(row.get(field) or '').strip()]
+            if missing:
+                errors.append({'row': number, 'error': f"Missing fields: {', '.join(missing)}"})
+                continue
+            try:
+                # quantize() raises InvalidOperation for infinities and for values past the context precision.
+                daily_price = Decimal(str(row['daily_price'])).quantize(PRICE_STEP)
+                available_copies = int(row['available_copies'])
+            except (InvalidOperation, ValueError):
+                errors.append({'row': number, 'error': "daily_price or available_copies is not a number"})
+                continue
+            if daily_price.is_nan() or abs(daily_price) >= PRICE_LIMIT:
+                errors.append({'row': number, 'error': f"daily_price must be below {PRICE_LIMIT}"})
+                continue
+            if available_copies < 0:
+                errors.append({'row': number, 'error': "available_copies must not be negative"})
+                continue
+            valid.append((row, daily_price, available_copies))
+
+        with transaction.atomic():
+            authors = self.resolve(Author, self.authors, {str(row['author']).strip() for row, _, _ in valid})
+            genres = self.resolve(Genre, self.genres, {str(row['genre']).strip() for row, _, _ in valid})
+            for row, daily_price, available_copies in valid:
+                name = str(row['name']).strip()
+                books.append(Book(
+                    name=name,
+                    cleaned_name=normalize_name(name),
+                    description=row.get('description') or '',
+                    author_id=authors[self.key(str(row['author']).strip())],
+                    genre_id=genres[self.key(str(row['genre']).strip())],
+                    daily_price=daily_price,
+                    available_copies=available_copies,
+                    is_available=str(row.get('is_available', True)).lower() not in ('0', 'false', 'no'),
+                ))
+            Book.objects.bulk_create(books)
+            if books:
+                search.index_book_range(books[0].pk, books[-1].pk + 1)
+        return len(books), errors
+
+    @staticmethod
+    def key(name):
+        # Names that clean down to nothing are matched exactly instead of all collapsing together.
+        return normalize_name(name) or name
+
+    @classmethod
+    def resolve(cls, model, known, names):
+        missing = {cls.key(name): name for name in names if cls.key(name) not in known}
+        if not missing:
+            return known
+
+        existing = model.objects.filter(Q(cleaned_name__in=missing) | Q(name__in=missing.values()))
+        for name, cleaned_name, pk in existing.values_list('name', 'cleaned_name', 'id'):
+            known.setdefault(cleaned_name or name, pk)
+            known.setdefault(cls.key(name), pk)
+
+        # Bulk inserts bypass save(), so cleaned_name is computed here.
+        new = [model(name=name, cleaned_name=normalize_name(name)) for key, name in missing.items() if key not in known]
+        if new:
+            model.objects.bulk_create(new, ignore_conflicts=True)
+            for name, pk in model.objects.filter(name__in=[obj.name for obj in new]).values_list('name', 'id'):
+                known[cls.key(name)] = pk
+        return known
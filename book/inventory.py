@@ -0,0 +1,180 @@
+"""Redis stock counters for hot books.
+
+For a book with ``hot_inventory`` set, Redis holds the number of copies that can still be reserved, and
+``/bron/`` claims a copy with a Lua decrement-if-positive instead of updating the Book row.
+
+Every stock change carries a token that is also stored on its InventoryDelta row, so reconciliation can
+tell from the database whether it committed. Per book there are three keys:
+
+- stock: copies left;
+- claims: sorted set of reservation tokens already taken off stock, until their transaction settles;
+- restores: sorted set of restore tokens whose copies are added to stock once their transaction commits.
+"""
+import logging
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Returns 1 if a copy was claimed, 0 if sold out, -1 if the counter is not loaded.
+CLAIM = """
+local stock = tonumber(redis.call('GET', KEYS[1]))
+if not stock then return -1 end
+if stock <= 0 then return 0 end
+redis.call('DECR', KEYS[1])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+return 1
+"""
+
+# Gives the copy back, unless the claim was already settled or released.
+RELEASE = """
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 1 then
+    redis.call('INCR', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+# Adds committed restored copies, once per token; a missing counter is left for reconcile to load.
+ADD = """
+if redis.call('ZREM', KEYS[3], ARGV[1]) == 1 and redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[2])
+end
+return nil
+"""
+
+# ARGV[1]: copies left according to the database, net of in-flight claims; ARGV[2]: number of claim
+# tokens that follow, i.e. the claims snapshot reconcile worked from. Claims made after that snapshot
+# are not in the database yet, so they are subtracted here. The remaining ARGV are restores the database
+# already counts: dropping them makes sure ADD never adds those copies a second time.
+RESET = """
+local stock = tonumber(ARGV[1])
+local claims = tonumber(ARGV[2])
+local known = {}
+for i = 3, 2 + claims do known[ARGV[i]] = true end
+for _, claim in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    if not known[claim] then stock = stock - 1 end
+end
+for i = 3 + claims, #ARGV do redis.call('ZREM', KEYS[3], ARGV[i]) end
+redis.call('SET', KEYS[1], stock)
+return stock
+"""
+
+_client = None
+_scripts = {}
+
+
+def client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.HOT_INVENTORY_REDIS_URL, socket_timeout=1)
+    return _client
+
+
+def script(source):
+    if source not in _scripts:
+        _scripts[source] = client().register_script(source)
+    return _scripts[source]
+
+
+def is_available():
+    try:
+        return client().ping()
+    except redis.RedisError:
+        return False
+
+
+def keys(book_id):
+    return [f"inventory:stock:{book_id}", f"inventory:claims:{book_id}", f"inventory:restores:{book_id}"]
+
+
+def run(source, calls, error):
+    # One pipelined script call per (book_id, args); returns the results in order, or None if Redis failed.
+    try:
+        with client().pipeline(transaction=False) as pipe:
+            for book_id, args in calls:
+                script(source)(keys=keys(book_id), args=args, client=pipe)
+            return pipe.execute()
+    except redis.RedisError:
+        logger.exception(error)
+        return None
+
+
+def claim(tokens):
+    """Claims one copy per book ({book_id: token}); returns {book_id: 1 | 0 | -1} as CLAIM does.
+
+    If Redis is unreachable every claim fails (0): hot books are sold only through Redis.
+    """
+    now = time.time()
+    results = run(CLAIM, [(book_id, [token, now]) for book_id, token in tokens.items()],
+                  "Hot inventory claim failed")
+    return dict(zip(tokens, results or [0] * len(tokens)))
+
+
+def settle(tokens):
+    # The claims committed as InventoryDelta rows; they no longer need to be tracked.
+    try:
+        with client().pipeline(transaction=False) as pipe:
+            for book_id, token in tokens.items():
+                pipe.zrem(keys(book_id)[1], token)
+            pipe.execute()
+    except redis.RedisError:
+        logger.exception("Hot inventory settle failed; reconcile will drop the claims")
+
+
+def release(tokens):
+    run(RELEASE, [(book_id, [token]) for book_id, token in tokens.items()],
+        "Hot inventory release failed; reconcile will return the copies")
+
+
+def expect_restores(tokens):
+    # Registered before the restoring transaction commits; add() applies each token at most once.
+    try:
+        now = time.time()
+        with client().pipeline(transaction=False) as pipe:
+            for book_id, token in tokens.items():
+                pipe.zadd(keys(book_id)[2], {token: now})
+            pipe.execute()
+    except redis.RedisError:
+        logger.exception("Hot inventory restore failed; reconcile will add the copies")
+
+
+def add(restores):
+    # {book_id: (token, amount)}
+    run(ADD, [(book_id, [token, amount]) for book_id, (token, amount) in restores.items()],
+        "Hot inventory restore failed; reconcile will add the copies")
+
+
+def pending(book_id):
+    # Claims and restores Redis is tracking: ({token: time}, {token: time}).
+    _, claims_key, restores_key = keys(book_id)
+    return tuple(
+        {member.decode(): score for member, score in client().zrange(key, 0, -1, withscores=True)}
+        for key in (claims_key, restores_key)
+    )
+
+
+def drop(book_id, claims=(), restores=()):
+    _, claims_key, restores_key = keys(book_id)
+    with client().pipeline(transaction=False) as pipe:
+        if claims:
+            pipe.zrem(claims_key, *claims)
+        if restores:
+            pipe.zrem(restores_key, *restores)
+        pipe.execute()
+
+
+def reset(book_id, available, claims, committed_restores):
+    return script(RESET)(keys=keys(book_id), args=[available, len(claims), *claims, *committed_restores])
+
+
+def forget(book_ids):
+    if book_ids:
+        client().delete(*[key for book_id in book_ids for key in keys(book_id)])
+
+
+def stock(book_id):
+    value = client().get(keys(book_id)[0])
+    return None if value is None else int(value)
@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from book.models import Rental
+
+
+class Command(BaseCommand):
+    help = ("Eski yopilgan (qaytarilgan/bekor) ijaralarni RentalArchive jadvaliga id oralig'i bo'yicha kichik "
+            "tranzaksiyalarda ko'chiradi; to'xtatilsa --from-id bilan davom ettiriladi")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.RENTAL_ARCHIVE_AFTER_DAYS,
+                            help="Shuncha kundan oldin yopilgan ijaralar ko'chiriladi")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--from-id', type=int, default=None, help="Shu id dan boshlab davom ettirish")
+        parser.add_argument('--sleep', type=float, default=0, help="Bo'laklar orasidagi pauza (soniya)")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = 0
+        for chunk in Rental.archive_closed(
+            older_than=timedelta(days=options['days']), chunk_size=options['chunk_size'], start_id=options['from_id'],
+        ):
+            total += chunk['rows']
+            self.stdout.write(f"id >= {chunk['start_id']}: {chunk['rows']} archived in {chunk['elapsed']:.3f}s")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} rentals in {time.monotonic() - started:.2f}s"))
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+
+from book import search
+from book.cache import bump_versions
+from book.models import Author, Book, Genre
+from book.normalize import normalize_name
+
+
+class Command(BaseCommand):
+    help = ("Genre/Author/Book cleaned_name maydonini yangi normalizatsiya bo'yicha qayta hisoblaydi: "
+            "id oralig'i bo'yicha kichik tranzaksiyalarda, jadvallarni uzoq bloklamasdan")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0, help="Bo'laklar orasidagi pauza (soniya)")
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        self.sleep = options['sleep']
+        started = time.monotonic()
+
+        # Authors and genres first: if any of them changed, every book's search document is stale.
+        changed_genres = self.backfill(Genre)
+        changed_authors = self.backfill(Author)
+        reindex_all = bool(changed_genres or changed_authors)
+        changed_books = self.backfill(Book, reindex_all=reindex_all)
+
+        bump_versions(*[name for name, changed in
+                        (('genre', changed_genres), ('author', changed_authors), ('book', changed_books)) if changed])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {changed_genres} genres, {changed_authors} authors, {changed_books} books in {elapsed:.2f}s"
+        ))
+
+    def backfill(self, model, reindex_all=False):
+        bounds = model.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return 0
+        total = 0
+        for start in range(bounds['low'], bounds['high'] + 1, self.chunk_size):
+            stop = start + self.chunk_size
+            with transaction.atomic():
+                rows = model.objects.filter(id__gte=start, id__lt=stop).values_list('id', 'name', 'cleaned_name')
+                stale = []
+                for pk, name, cleaned_name in rows:
+                    normalized = normalize_name(name)
+                    if normalized != cleaned_name:
+                        stale.append(model(id=pk, cleaned_name=normalized))
+                # bulk_update bypasses save(), so the search index is refreshed here.
+                model.objects.bulk_update(stale, ['cleaned_name'], batch_size=1000)
+                if model is Book and (stale or reindex_all):
+                    search.index_book_range(start, stop)
+            total += len(stale)
+            self.stdout.write(f"{model.__name__} id >= {start}: {len(stale)} updated")
+            if self.sleep:
+                time.sleep(self.sleep)
+        return total
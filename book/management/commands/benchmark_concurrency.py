@@ -0,0 +1,90 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Ishlab turgan serverga bir vaqtda N ta ulanish bilan so'rov yuboradi. Bitta worker jarayonini "
+        "WSGI (masalan gunicorn config.wsgi -w 1) va ASGI (uvicorn config.asgi:application --workers 1) "
+        "rejimlarida solishtirish uchun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help="Bir necha marta berish mumkin (default: /books/ va /async/books/)")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200, 500])
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--timeout', type=float, default=10)
+        parser.add_argument('--token', help="Authorization: Token <token>")
+        parser.add_argument('--output', default='concurrency_output.json')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        self.host, self.port = url.hostname, url.port or 80
+        self.timeout = options['timeout']
+        self.headers = f"Authorization: Token {options['token']}\r\n" if options['token'] else ''
+
+        results = {}
+        for path in options['paths'] or ['/books/', '/async/books/']:
+            results[path] = {}
+            for concurrency in options['concurrency']:
+                result = asyncio.run(self.run(path, concurrency, options['duration']))
+                results[path][concurrency] = result
+                self.stdout.write(
+                    f"{path:<20} c={concurrency:<5} {result['requests_per_second']:>8.1f} req/s  "
+                    f"p95={result['p95_ms']:>9.1f}ms  errors={result['errors']}"
+                )
+
+        with open(options['output'], 'w') as output:
+            json.dump({'url': options['url'], 'duration': options['duration'], 'results': results}, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Natija {options['output']} fayliga yozildi"))
+
+    async def request(self, path):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: close\r\n{self.headers}\r\n".encode()
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+
+    async def run(self, path, concurrency, duration):
+        latencies, errors = [], 0
+        deadline = time.monotonic() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(self.request(path), self.timeout)
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                    errors += 1
+                    continue
+                if status >= 500:
+                    errors += 1
+                else:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentiles[49], 2),
+            'p95_ms': round(percentiles[94], 2),
+            'p99_ms': round(percentiles[98], 2),
+        }
@@ -0,0 +1,149 @@
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from book.models import Author, Basket, Book, Genre, Rental, User
+
+SEARCH_TERMS = ('kitob', 'bahor', 'yulduz daryo', 'oltin', 'tong')
+
+
+class Command(BaseCommand):
+    help = "Endpointlarni Django test client orqali o'lchaydi va natijani JSON faylga yozadi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--email', help="So'rovlar shu foydalanuvchi nomidan yuboriladi")
+        parser.add_argument('--output', default='bench_output.json')
+        parser.add_argument('--compare', help="Oldingi natija fayli bilan solishtirish")
+        parser.add_argument('--performance-metrics', action='store_true',
+                            help="PerformanceMiddleware yoqilgan holda o'lchash (overhead uchun)")
+
+    def handle(self, *args, **options):
+        with override_settings(PERFORMANCE_METRICS=options['performance_metrics']):
+            self.run(options)
+
+    def run(self, options):
+        user = self.get_user(options['email'])
+        self.client = Client()
+        self.client.force_login(user)
+        self.user = user
+
+        book = Book.objects.order_by('-trending_score', 'id').first()
+        author = Author.objects.order_by('id').first()
+        genre = Genre.objects.order_by('id').first()
+        rental = Rental.objects.filter(user=user, status__in=Rental.ACTIVE_STATUSES).order_by('id').first()
+        if not (book and author and genre):
+            raise CommandError("Avval seed_data buyrug'i bilan ma'lumot yarating.")
+
+        endpoints = {
+            'books': lambda i: self.client.get('/books/'),
+            'book_detail': lambda i: self.client.get(f'/book/{book.pk}'),
+            'trending': lambda i: self.client.get('/books/trending/'),
+            'search': lambda i: self.client.get('/search/', {'search': SEARCH_TERMS[i % len(SEARCH_TERMS)]}),
+            'genre_books': lambda i: self.client.get(f'/genre/{genre.pk}'),
+            'author_books': lambda i: self.client.get(f'/author/{author.pk}'),
+            'rentals': lambda i: self.client.get('/rentals/'),
+            'bron_history': lambda i: self.client.get('/bron/'),
+            'bron_create': self.reserve,
+        }
+        if rental:
+            endpoints['rental_detail'] = lambda i: self.client.get(f'/rental/{rental.pk}')
+
+        results = {
+            name: self.measure(request, options['iterations'], options['warmup'])
+            for name, request in endpoints.items()
+        }
+        report = {
+            'commit': self.git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'rows': {model.__name__: model.objects.count() for model in (Author, Genre, Book, User, Rental)},
+            'iterations': options['iterations'],
+            'performance_metrics': options['performance_metrics'],
+            'endpoints': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+
+        self.print_report(results, options['compare'])
+        self.stdout.write(self.style.SUCCESS(f"Natija {options['output']} fayliga yozildi"))
+
+    def get_user(self, email):
+        users = User.objects.all()
+        if email:
+            users = users.filter(email=email)
+        user = users.filter(role='admin').order_by('id').first() or users.order_by('id').first()
+        if user is None:
+            raise CommandError("Foydalanuvchi topilmadi.")
+        return user
+
+    def reserve(self, iteration):
+        # Reservations write, so every iteration runs in a transaction that is rolled back afterwards.
+        with transaction.atomic():
+            books = Book.objects.filter(available_copies__gt=0).order_by('id')[iteration * 3:iteration * 3 + 3]
+            Basket.objects.bulk_create([Basket(user=self.user, book=book) for book in books], ignore_conflicts=True)
+            response = self.client.post('/bron/')
+            transaction.set_rollback(True)
+        return response
+
+    def measure(self, request, iterations, warmup):
+        for i in range(warmup):
+            request(i)
+
+        timings, queries = [], []
+        for i in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request(i)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured.captured_queries))
+
+        # Allocation tracing slows requests down, so memory is measured on a separate run.
+        tracemalloc.start()
+        request(iterations)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        percentiles = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+        return {
+            'status': response.status_code,
+            'p50_ms': round(percentiles[49], 3),
+            'p95_ms': round(percentiles[94], 3),
+            'p99_ms': round(percentiles[98], 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def print_report(self, results, compare):
+        previous = {}
+        if compare:
+            with open(compare) as baseline:
+                previous = json.load(baseline)['endpoints']
+
+        self.stdout.write(f"{'endpoint':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'queries':>9}{'memory KB':>11}")
+        for name, result in results.items():
+            line = (f"{name:<16}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                    f"{result['queries']:>9}{result['peak_memory_kb']:>11.1f}")
+            if name in previous and previous[name]['p95_ms']:
+                change = (result['p95_ms'] - previous[name]['p95_ms']) / previous[name]['p95_ms'] * 100
+                line += f"   p95 {change:+.1f}%"
+            self.stdout.write(line)
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR).stdout.strip()
+        except OSError:
+            return None
@@ -0,0 +1,78 @@
+import time
+import tracemalloc
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from book import recommendations
+
+
+class Command(BaseCommand):
+    help = ("Co-rental matritsasini sintetik ijara tarixida to'liq va inkremental qurish vaqti va xotirasini "
+            "o'lchaydi (bazaga murojaat qilmaydi)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=200000)
+        parser.add_argument('--rentals', type=int, default=10000000)
+        parser.add_argument('--new-rentals', type=int, default=100000, help="Inkremental yangilash hajmi")
+        parser.add_argument('--skew', type=float, default=1.1, help="Zipf eksponenti")
+        parser.add_argument('--batch-size', type=int, default=500, help="Bir partiyadagi o'quvchilar soni")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        total = options['rentals'] + options['new_rentals']
+        users = self.zipf(rng, options['users'], total, options['skew'])
+        books = self.zipf(rng, options['books'], total, options['skew'])
+        ids = np.arange(1, total + 1, dtype=np.int64)
+        shape = options['books'] + 1
+        self.batch_size = options['batch_size']
+        old, high = options['rentals'], total
+
+        self.stdout.write(f"{'phase':<14}{'readers':>9}{'seconds':>10}{'peak MB':>10}{'nnz/books':>14}")
+        matrix = self.measure('full build', lambda: recommendations.change(
+            self.histories(users, books, ids, np.unique(users[:old]), old), 0, old, shape), users[:old])
+        neighbors = self.measure('full top-K', lambda: self.rank(matrix, np.flatnonzero(np.diff(matrix.indptr))),
+                                 trace=False)
+        self.stdout.write(f"books with neighbors: {sum(1 for items in neighbors.values() if items)}")
+
+        readers = np.unique(users[old:])
+        delta = self.measure('incremental', lambda: recommendations.change(
+            self.histories(users, books, ids, readers, high), old, high, shape), readers)
+        matrix = (matrix + delta).tocsr()
+        self.measure('incr. top-K', lambda: self.rank(matrix, recommendations.stale_rows(matrix, delta)), trace=False)
+
+    @staticmethod
+    def zipf(rng, count, size, exponent):
+        weights = 1 / np.arange(1, count + 1) ** exponent
+        return rng.choice(np.arange(1, count + 1), size=size, p=weights / weights.sum())
+
+    def histories(self, users, books, ids, readers, high):
+        # Same batches update() reads from the database: the readers' rentals up to `high`.
+        mask = ids <= high
+        order = np.argsort(users[mask], kind='stable')
+        users, books, ids = users[mask][order], books[mask][order], ids[mask][order]
+        for i in range(0, len(readers), self.batch_size):
+            batch = readers[i:i + self.batch_size]
+            start, end = np.searchsorted(users, batch[0]), np.searchsorted(users, batch[-1], side='right')
+            keep = np.isin(users[start:end], batch)
+            yield users[start:end][keep], books[start:end][keep], ids[start:end][keep]
+
+    @staticmethod
+    def rank(matrix, book_ids):
+        return recommendations.top_neighbors(matrix, book_ids, settings.RECOMMENDATIONS_TOP_K)
+
+    def measure(self, phase, run, readers=(), trace=True):
+        # tracemalloc slows down the per-book Python loop of top-K several times, so it is timed untraced.
+        if trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - started
+        peak = f"{tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f}" if trace else '-'
+        tracemalloc.stop()
+        pairs = result.nnz if hasattr(result, 'nnz') else len(result)
+        self.stdout.write(f"{phase:<14}{len(np.unique(readers)):>9}{elapsed:>10.2f}{peak:>10}{pairs:>14}")
+        return result
@@ -0,0 +1,77 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from book.models import Author, Book, Genre, Rental
+from book.renderers import ORJSONRenderer
+from book.serializer import BookRowSerializer, BookSerializer, RentalRowSerializer, RentalSerializer
+
+
+class Command(BaseCommand):
+    help = ("ModelSerializer + JSONRenderer va values() fast path + ORJSONRenderer serializatsiya tezligini "
+            "solishtiradi (bazaga murojaat qilmaydi)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=3, help="Har o'lchovdan eng yaxshisi olinadi")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'serializer':<10}{'rows':>9}{'drf ms':>11}{'fast ms':>11}{'speedup':>10}")
+        for count in options['rows']:
+            books, book_rows = self.books(count)
+            rentals, rental_rows = self.rentals(books)
+            cases = {
+                'book': (lambda: BookSerializer(books, many=True).data, lambda: BookRowSerializer(book_rows).data),
+                'rental': (lambda: RentalSerializer(rentals, many=True).data,
+                           lambda: RentalRowSerializer(rental_rows).data),
+            }
+            for name, (drf_data, fast_data) in cases.items():
+                drf_ms, drf_output = self.measure(lambda: JSONRenderer().render(drf_data()), options['repeat'])
+                fast_ms, fast_output = self.measure(lambda: ORJSONRenderer().render(fast_data()), options['repeat'])
+                if drf_output != fast_output:
+                    raise CommandError(f"{name}: fast path natijasi DRF natijasidan farq qiladi")
+                self.stdout.write(f"{name:<10}{count:>9}{drf_ms:>11.1f}{fast_ms:>11.1f}{drf_ms / fast_ms:>9.1f}x")
+
+    @staticmethod
+    def measure(render, repeat):
+        best, output = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = render()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
+
+    @staticmethod
+    def books(count):
+        # Unsaved instances and the matching values() rows: only serialization and rendering are timed.
+        authors = [Author(id=i, name=f"Muallif {i}") for i in range(1, 101)]
+        genres = [Genre(id=i, name=f"Janr {i}") for i in range(1, 21)]
+        books, rows = [], []
+        for i in range(1, count + 1):
+            book = Book(id=i, name=f"Kitob {i}", description=f"Kitob {i} haqida qisqacha ma'lumot",
+                        author=authors[i % 100], genre=genres[i % 20],
+                        daily_price=Decimal(1000 + i % 9000).quantize(Decimal('0.01')),
+                        available_copies=i % 7, is_available=i % 7 > 0)
+            books.append(book)
+            rows.append({'id': book.id, 'name': book.name, 'description': book.description,
+                         'author__name': book.author.name, 'genre__name': book.genre.name,
+                         'daily_price': book.daily_price, 'available_copies': book.available_copies,
+                         'is_available': book.is_available})
+        return books, rows
+
+    @staticmethod
+    def rentals(books):
+        now = timezone.now()
+        rentals, rows = [], []
+        for book in books:
+            rental = Rental(id=book.id, book=book, start_date=now, end_date=now + timedelta(days=book.id % 14),
+                            status='ijara', penalty=Decimal('0.00'))
+            rentals.append(rental)
+            rows.append({'id': rental.id, 'book__name': book.name, 'start_date': rental.start_date,
+                         'end_date': rental.end_date, 'status': rental.status, 'penalty': rental.penalty})
+        return rentals, rows
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from book import inventory
+from book.models import Book, InventoryDelta
+
+
+class Command(BaseCommand):
+    help = ("Kitoblarni Redis zaxira hisoblagichlariga o'tkazadi (--add) yoki qaytaradi (--remove); "
+            "argumentsiz ro'yxatni chiqaradi")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--add', type=int, nargs='+', default=[], metavar='BOOK_ID')
+        parser.add_argument('--remove', type=int, nargs='+', default=[], metavar='BOOK_ID')
+
+    def handle(self, *args, **options):
+        if not inventory.is_available():
+            raise CommandError("HOT_INVENTORY_REDIS_URL dagi Redis bilan bog'lanib bo'lmadi.")
+
+        if options['add']:
+            Book.objects.filter(pk__in=options['add']).update(hot_inventory=True)
+            InventoryDelta.reconcile(options['add'])
+        if options['remove']:
+            # New reservations go back to the Book row; pending deltas are written to it first.
+            Book.objects.filter(pk__in=options['remove']).update(hot_inventory=False)
+            InventoryDelta.flush()
+            inventory.forget(options['remove'])
+
+        for book_id, name, available in Book.objects.filter(hot_inventory=True).order_by('id') \
+                .values_list('id', 'name', 'available_copies'):
+            self.stdout.write(f"{book_id}: {name} — redis={inventory.stock(book_id)} db={available}")
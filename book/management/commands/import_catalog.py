@@ -0,0 +1,39 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from book.importer import CatalogImporter, CatalogImportError, read_rows, text_stream
+
+
+class Command(BaseCommand):
+    help = "CSV yoki JSONL katalog faylini bo'laklab (bulk_create) import qiladi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--type', choices=['csv', 'jsonl'], help="Fayl kengaytmasidan aniqlanadi")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--skip', type=int, default=0, help="Oldingi importda saqlangan qatorlar soni")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        import_type = options['type'] or path.suffix.lstrip('.').lower()
+        if import_type not in ('csv', 'jsonl'):
+            raise CommandError("Fayl turi csv yoki jsonl bo'lishi kerak (--type).")
+        if options['skip'] < 0:
+            raise CommandError("--skip manfiy bo'lmasligi kerak.")
+
+        importer = CatalogImporter(chunk_size=options['chunk_size'], progress=self.progress)
+        with path.open('rb') as file:
+            try:
+                stats = importer.run(read_rows(text_stream(file), import_type), skip=options['skip'])
+            except CatalogImportError as exc:
+                raise CommandError(f"{exc}\nDavom ettirish uchun: --skip {exc.resume_from}")
+
+        for error in stats['errors']:
+            self.stdout.write(self.style.WARNING(f"row {error['row']}: {error['error']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['imported']} books, skipped {stats['skipped']} rows in {stats['elapsed']:.1f}s"
+        ))
+
+    def progress(self, rows, imported, chunk_rows, chunk_seconds, rows_per_second):
+        self.stdout.write(f"{rows} rows read, {imported} imported ({rows_per_second:.0f} rows/s)")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from book.models import BookRecommendation
+
+
+class Command(BaseCommand):
+    help = ("Co-rental tavsiyalarini yangilaydi: oxirgi ishga tushirishdan keyingi ijaralarni qo'shadi "
+            "(--full bilan matritsa noldan quriladi)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Matritsani butun tarixdan qayta qurish")
+
+    def handle(self, *args, **options):
+        stats = BookRecommendation.rebuild(full=options['full'])
+        if stats is None:
+            raise CommandError("Tavsiyalar hozir boshqa jarayon tomonidan yangilanmoqda.")
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['readers']} readers, rentals {stats['from_rental_id']}..{stats['to_rental_id']}: "
+            f"{stats['changed_books']} books re-ranked, {stats['pairs']} pairs in {stats['elapsed']:.2f}s"
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from book import search
+
+
+class Command(BaseCommand):
+    help = "Kitoblar qidiruv indeksini (SQLite FTS5) noldan qayta quradi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            raise CommandError("FTS5 qidiruv indeksi faqat SQLite bazasida ishlaydi (BOOK_SEARCH_FTS).")
+
+        started = time.monotonic()
+        total = 0
+        for start, rows in search.rebuild_index(chunk_size=options['chunk_size']):
+            total += rows
+            self.stdout.write(f"id >= {start}: {rows} books indexed")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} books in {elapsed:.2f}s"))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from book.models import User, UserBalance
+
+
+class Command(BaseCommand):
+    help = "UserBalance jadvalini Rental jadvali bilan solishtiradi va --fix bilan farqlarni tuzatadi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Farq topilgan balanslarni qayta hisoblash")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = User.objects.aggregate(last=Max('id'))['last'] or 0
+        checked = drifted = 0
+
+        for start in range(1, last_id + 1, chunk_size):
+            expected = {
+                pk: (debt, active_rentals)
+                for pk, debt, active_rentals in User.objects.filter(id__gte=start, id__lt=start + chunk_size)
+                .annotate(**UserBalance.totals('pk')).values_list('pk', 'debt', 'active_rentals')
+            }
+            ledger = {
+                user_id: (debt, active_rentals)
+                for user_id, debt, active_rentals in UserBalance.objects.filter(user_id__in=expected)
+                .values_list('user_id', 'debt', 'active_rentals')
+            }
+            stale = [
+                pk for pk, totals in expected.items()
+                if ledger.get(pk, (0, 0)) != totals
+            ]
+            checked += len(expected)
+            drifted += len(stale)
+            for pk in stale:
+                self.stdout.write(f"user={pk}: ledger={ledger.get(pk)} expected={expected[pk]}")
+            if stale and options['fix']:
+                with transaction.atomic():
+                    UserBalance.refresh(stale)
+
+        action = "fixed" if options['fix'] else "found"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} users, {action} {drifted} drifted balances"))
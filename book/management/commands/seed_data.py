@@ -0,0 +1,156 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from book import search
+from book.cache import bump_versions
+from book.models import Assessment, Author, Book, Genre, Rental, User, UserBalance
+
+WORDS = (
+    'alpha', 'bahor', 'qalb', 'yulduz', 'daryo', 'tog', 'shamol', 'kitob', 'sir', 'oltin', 'kecha', 'tong',
+    'iz', 'yol', 'bog', 'dengiz', 'osmon', 'sahro', 'sado', 'nur', 'orzu', 'vatan', 'ona', 'umr',
+)
+RENTAL_STATUSES = (('qaytarilgan', 60), ('bekor', 10), ('ijara', 15), ('bron', 15))
+
+
+def zipf_weights(count, exponent):
+    # Rank-based skew: a few authors, books and users account for most of the activity.
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+@contextmanager
+def manual_timestamps(model, *field_names):
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = "Benchmark uchun takrorlanadigan sintetik ma'lumotlar to'plamini bulk insert bilan yaratadi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--genres', type=int, default=50)
+        parser.add_argument('--books', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--rentals', type=int, default=200000)
+        parser.add_argument('--assessments', type=int, default=50000)
+        parser.add_argument('--skew', type=float, default=1.1, help="Zipf eksponenti")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        started = time.monotonic()
+
+        authors = self.create_named(Author, options['authors'], 'Author')
+        genres = self.create_named(Genre, options['genres'], 'Genre')
+        books = self.create_books(options['books'], authors, genres)
+        users = self.create_users(options['users'])
+        self.create_rentals(options['rentals'], users, books)
+        self.create_assessments(options['assessments'], users, books)
+
+        for _ in search.rebuild_index():
+            pass
+        bump_versions('book', 'author', 'genre')
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.monotonic() - started:.1f}s"))
+
+    def insert(self, model, objects):
+        started = time.monotonic()
+        with transaction.atomic():
+            model.objects.bulk_create(objects, batch_size=self.batch_size)
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"{model.__name__}: {len(objects)} rows in {elapsed:.2f}s")
+
+    def ids_after(self, model, last_id):
+        return list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+
+    def title(self, words=3):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words)).capitalize()
+
+    def create_named(self, model, count, prefix):
+        last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+        # Generated names only contain letters, digits and spaces, so cleaning is just lower-casing.
+        names = [f"{prefix} {last_id + number} {self.title(2)}" for number in range(1, count + 1)]
+        self.insert(model, [model(name=name, cleaned_name=name.lower()) for name in names])
+        return self.ids_after(model, last_id)
+
+    def create_books(self, count, authors, genres):
+        last_id = Book.objects.aggregate(last=Max('id'))['last'] or 0
+        author_ids = self.rng.choices(authors, weights=zipf_weights(len(authors), self.skew), k=count)
+        genre_ids = self.rng.choices(genres, weights=zipf_weights(len(genres), self.skew), k=count)
+        books = []
+        for number, (author_id, genre_id) in enumerate(zip(author_ids, genre_ids), start=1):
+            name = f"{self.title()} {last_id + number}"
+            books.append(Book(
+                name=name, cleaned_name=name.lower(), description=self.title(12), author_id=author_id,
+                genre_id=genre_id, daily_price=Decimal(self.rng.randrange(1000, 20000, 500)),
+                available_copies=self.rng.randint(0, 20),
+            ))
+        self.insert(Book, books)
+        return self.ids_after(Book, last_id)
+
+    def create_users(self, count):
+        last_id = User.objects.aggregate(last=Max('id'))['last'] or 0
+        password = make_password('benchmark')
+        users = [
+            User(email=f"user{last_id + number}@example.com", password=password, full_name=self.title(2))
+            for number in range(1, count + 1)
+        ]
+        self.insert(User, users)
+        return self.ids_after(User, last_id)
+
+    def create_rentals(self, count, users, books):
+        if not count:
+            return
+        now = timezone.now()
+        statuses, status_weights = zip(*RENTAL_STATUSES)
+        user_ids = self.rng.choices(users, weights=zipf_weights(len(users), self.skew), k=count)
+        book_ids = self.rng.choices(books, weights=zipf_weights(len(books), self.skew), k=count)
+        rentals = []
+        active = set()
+        for user_id, book_id in zip(user_ids, book_ids):
+            status = self.rng.choices(statuses, weights=status_weights)[0]
+            if status in Rental.ACTIVE_STATUSES:
+                # A reader has at most one active rental of a book (rental_one_active_per_book): the
+                # Zipf draws repeat pairs often, and the repeats become past rentals.
+                if (user_id, book_id) in active:
+                    status = 'qaytarilgan'
+                active.add((user_id, book_id))
+            created_at = now - timedelta(minutes=self.rng.randrange(0, 365 * 24 * 60))
+            rental = Rental(user_id=user_id, book_id=book_id, status=status, created_at=created_at,
+                            updated_at=created_at)
+            if status == 'bron':
+                rental.expires_at = created_at + Rental.BRON_TTL
+            if status in ('ijara', 'qaytarilgan'):
+                rental.start_date = created_at + timedelta(hours=self.rng.randint(1, 23))
+                rental.end_date = rental.start_date + timedelta(days=self.rng.randint(1, 30))
+            rentals.append(rental)
+        with manual_timestamps(Rental, 'created_at', 'updated_at'):
+            self.insert(Rental, rentals)
+        with transaction.atomic():
+            UserBalance.refresh(set(user_ids))
+
+    def create_assessments(self, count, users, books):
+        user_ids = self.rng.choices(users, k=count)
+        book_ids = self.rng.choices(books, weights=zipf_weights(len(books), self.skew), k=count)
+        self.insert(Assessment, [
+            Assessment(user_id=user_id, book_id=book_id, rating=str(self.rng.randint(1, 5)), comment=self.title(6))
+            for user_id, book_id in zip(user_ids, book_ids)
+        ])
@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db import connection
+
+# Latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_current = ContextVar('request_stats', default=None)
+
+# Written by the Celery worker, read by /metrics in the web processes.
+EXPIRY_STATS_KEY = 'reservation_expiry_stats'
+EXPIRED_TOTAL_KEY = 'reservation_expired_total'
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'cache_hits', 'cache_misses', 'cache_time', 'render_started', 'render_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_time = 0.0
+        self.render_started = None
+        self.render_time = 0.0
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def server_timing(self, total):
+        app = max(total - self.db_time - self.cache_time - self.render_time, 0)
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"',
+            f'cache;dur={self.cache_time * 1000:.2f};desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'render;dur={self.render_time * 1000:.2f}',
+            f'app;dur={app * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.sql_wrapper(execute, sql, params, many, context)
+
+
+def watch_queries():
+    # Installed once on the calling thread's connection and left there: it only records while a request's
+    # stats are current, and sync_to_async threads run in a copy of the request's context, so they see them.
+    # Inserted first, so an enclosing execute_wrapper() block still pops its own wrapper when it exits.
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, sql_wrapper)
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def record_cache(hit, duration):
+    stats = _current.get()
+    if stats is None:
+        return
+    if hit:
+        stats.cache_hits += 1
+    else:
+        stats.cache_misses += 1
+    stats.cache_time += duration
+
+
+def record_expiry(expired, max_lag):
+    cache.set(EXPIRY_STATS_KEY, {'max_lag': max_lag, 'ran_at': time.time()}, timeout=None)
+    cache.add(EXPIRED_TOTAL_KEY, 0, timeout=None)
+    if expired:
+        cache.incr(EXPIRED_TOTAL_KEY, expired)
+
+
+def expiry_lines():
+    stats = cache.get(EXPIRY_STATS_KEY)
+    if stats is None:
+        return []
+    return [
+        '# HELP reservation_expiry_lag_seconds How overdue the oldest reservation expired by the last run was.',
+        '# TYPE reservation_expiry_lag_seconds gauge',
+        f'reservation_expiry_lag_seconds {stats["max_lag"]:.3f}',
+        '# HELP reservation_expiry_last_run_timestamp_seconds When the expiry poller last ran.',
+        '# TYPE reservation_expiry_last_run_timestamp_seconds gauge',
+        f'reservation_expiry_last_run_timestamp_seconds {stats["ran_at"]:.3f}',
+        '# HELP reservations_expired_total Reservations cancelled by the expiry poller.',
+        '# TYPE reservations_expired_total counter',
+        f'reservations_expired_total {cache.get(EXPIRED_TOTAL_KEY, 0)}',
+    ]
+
+
+class Registry:
+    """Per-process aggregation of request metrics, exported in the Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.buckets = defaultdict(lambda: [0] * len(BUCKETS))
+        self.latency_sum = defaultdict(float)
+        self.latency_count = defaultdict(int)
+        self.queries = defaultdict(int)
+        self.db_seconds = defaultdict(float)
+        self.cache = defaultdict(int)
+
+    def observe(self, view, method, status_code, total, stats):
+        with self.lock:
+            self.requests[(view, method, status_code)] += 1
+            buckets = self.buckets[view]
+            for index, bound in enumerate(BUCKETS):
+                if total <= bound:
+                    buckets[index] += 1
+            self.latency_sum[view] += total
+            self.latency_count[view] += 1
+            self.queries[view] += stats.queries
+            self.db_seconds[view] += stats.db_time
+            self.cache[(view, 'hit')] += stats.cache_hits
+            self.cache[(view, 'miss')] += stats.cache_misses
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines += ['# HELP http_requests_total Requests by view, method and status.',
+                      '# TYPE http_requests_total counter']
+            for (view, method, status_code), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{view="{view}",method="{method}",status="{status_code}"}} {count}')
+
+            lines += ['# HELP http_request_duration_seconds Request latency by view.',
+                      '# TYPE http_request_duration_seconds histogram']
+            for view, buckets in sorted(self.buckets.items()):
+                for bound, count in zip(BUCKETS, buckets):
+                    lines.append(f'http_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+                lines.append(f'http_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} '
+                             f'{self.latency_count[view]}')
+                lines.append(f'http_request_duration_seconds_sum{{view="{view}"}} {self.latency_sum[view]:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{view="{view}"}} {self.latency_count[view]}')
+
+            lines += ['# HELP db_queries_total SQL queries executed by view.', '# TYPE db_queries_total counter']
+            lines += [f'db_queries_total{{view="{view}"}} {count}' for view, count in sorted(self.queries.items())]
+            lines += ['# HELP db_query_seconds_total Time spent in SQL by view.',
+                      '# TYPE db_query_seconds_total counter']
+            lines += [f'db_query_seconds_total{{view="{view}"}} {seconds:.6f}'
+                      for view, seconds in sorted(self.db_seconds.items())]
+            lines += ['# HELP cache_requests_total Cache lookups by view and result.',
+                      '# TYPE cache_requests_total counter']
+            lines += [f'cache_requests_total{{view="{view}",result="{result}"}} {count}'
+                      for (view, result), count in sorted(self.cache.items())]
+        lines += expiry_lines()
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
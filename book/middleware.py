@@ -0,0 +1,135 @@
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+
+from book import metrics, routers
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PerformanceMiddleware:
+    """Records SQL, cache, render and total time per request (Server-Timing header and /metrics)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERFORMANCE_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = metrics.start_request()
+        request._performance_stats = stats
+        started = time.perf_counter()
+        try:
+            metrics.watch_queries()
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.record(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, token = metrics.start_request()
+        request._performance_stats = stats
+        started = time.perf_counter()
+        try:
+            # The async ORM queries from the thread-sensitive sync_to_async thread, on that thread's connection.
+            await sync_to_async(metrics.watch_queries)()
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.record(request, response, stats, started)
+
+    @staticmethod
+    def record(request, response, stats, started):
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        response['Server-Timing'] = stats.server_timing(total)
+        metrics.registry.observe(view, request.method, response.status_code, total, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook; time it with a post-render callback.
+        stats = request._performance_stats
+        stats.render_started = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: self.rendered(stats))
+        return response
+
+    @staticmethod
+    def rendered(stats):
+        stats.render_time += time.perf_counter() - stats.render_started
+
+
+def pin_key(credentials):
+    return f"db_pin_{hashlib.sha256(credentials.encode()).hexdigest()}"
+
+
+class ReplicaRoutingMiddleware:
+    """Lets safe requests read from replicas, except for clients that wrote within READ_YOUR_WRITES_SECONDS."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        keys = self.client_keys(request)
+        safe = request.method in SAFE_METHODS
+        pinned = bool(keys) and bool(cache.get_many(keys))
+
+        token = routers.allow_replica_reads(safe and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.reset_replica_reads(token)
+
+        if not safe:
+            cache.set_many(self.pins(keys, response), timeout=settings.READ_YOUR_WRITES_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        keys = self.client_keys(request)
+        safe = request.method in SAFE_METHODS
+        pinned = bool(keys) and bool(await cache.aget_many(keys))
+
+        # The ORM's sync_to_async threads run in a copy of this context, so they see the flag too.
+        token = routers.allow_replica_reads(safe and not pinned)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.reset_replica_reads(token)
+
+        if not safe:
+            await cache.aset_many(self.pins(keys, response), timeout=settings.READ_YOUR_WRITES_SECONDS)
+        return response
+
+    @staticmethod
+    def client_keys(request):
+        # Identify the client without a database lookup: its token or its session cookie.
+        credentials = [request.headers.get('Authorization'), request.COOKIES.get(settings.SESSION_COOKIE_NAME)]
+        return [pin_key(value) for value in credentials if value]
+
+    @staticmethod
+    def pins(keys, response):
+        # Logging in issues a new session cookie; pin the client under that one too.
+        session_cookie = response.cookies.get(settings.SESSION_COOKIE_NAME)
+        if session_cookie and session_cookie.value:
+            keys = [*keys, pin_key(session_cookie.value)]
+        return {key: 1 for key in keys}
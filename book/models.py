@@ -1,15 +1,41 @@
-import re
-from datetime import timedelta
-
+import logging
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AbstractUser, UserManager
-from django.db import models
-from django.db.models import Sum
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.utils.timezone import now
 
+from book import inventory, metrics, recommendations, search
+from book.cache import bump_versions
+from book.normalize import normalize_name
+
+logger = logging.getLogger(__name__)
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # No post_save is sent (bulk_update ends up here too), so the auth cache entries of the updated
+        # users, e.g. is_active=False or a new password, are dropped here.
+        from book.authentication import users_changed
 
-class CustomUserManager(UserManager):
+        user_ids = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        users_changed(user_ids)
+        return rows
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
     def _create_user(self, email, password, **extra_fields):
         if not email:
             raise ValueError("The email must be set")
@@ -65,15 +91,17 @@ class User(AbstractUser):
 # ---------------------------------------------  Genre ------------------------------------------------------- #
 class Genre(models.Model):
     name = models.CharField(max_length=255, unique=True)
-    cleaned_name = models.CharField(max_length=255, blank=True)
+    cleaned_name = models.CharField(max_length=255, blank=True, db_index=True)
 
     class Meta:
         verbose_name = 'Genre'
         verbose_name_plural = 'Genres'
 
     def save(self, *args, **kwargs):
-        self.cleaned_name = re.sub(r"[^a-zA-Z0-9\s]", "", self.name).lower().strip()
+        self.cleaned_name = normalize_name(self.name)
         super().save(*args, **kwargs)
+        search.index_genre_books(self.pk)
+        bump_versions('genre')
 
     def __str__(self):
         return self.name
@@ -82,15 +110,17 @@ class Genre(models.Model):
 # ---------------------------------------------  Author ------------------------------------------------------- #
 class Author(models.Model):
     name = models.CharField(max_length=255, unique=True)
-    cleaned_name = models.CharField(max_length=255, blank=True)
+    cleaned_name = models.CharField(max_length=255, blank=True, db_index=True)
 
     class Meta:
         verbose_name = 'Author'
         verbose_name_plural = 'Authors'
 
     def save(self, *args, **kwargs):
-        self.cleaned_name = re.sub(r"[^a-zA-Z0-9\s]", "", self.name).lower().strip()
+        self.cleaned_name = normalize_name(self.name)
         super().save(*args, **kwargs)
+        search.index_author_books(self.pk)
+        bump_versions('author')
 
     def __str__(self):
         return self.name
@@ -99,26 +129,102 @@ class Author(models.Model):
 # ---------------------------------------------  Book ------------------------------------------------------- #
 class Book(models.Model):
     name = models.CharField(max_length=255)
-    cleaned_name = models.CharField(max_length=255,  blank=True)
+    cleaned_name = models.CharField(max_length=255, blank=True, db_index=True)
     description = models.TextField()
     author = models.ForeignKey(Author, on_delete=models.CASCADE)
     genre = models.ForeignKey(Genre, on_delete=models.CASCADE)
     daily_price = models.DecimalField(max_digits=10, decimal_places=2)
     available_copies = models.PositiveIntegerField()
     is_available = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    trending_score = models.FloatField(default=0, db_index=True)
+    # Stock is reserved through Redis counters (book.inventory); see InventoryDelta.
+    hot_inventory = models.BooleanField(default=False, db_index=True)
 
     def save(self, *args, **kwargs):
-        self.cleaned_name = re.sub(r"[^a-zA-Z0-9\s]", "", self.name).lower().strip()
+        self.cleaned_name = normalize_name(self.name)
         super().save(*args, **kwargs)
+        search.index_book(self.pk)
+        bump_versions('book')
 
     class Meta:
         verbose_name = 'Book'
         verbose_name_plural = 'Books'
 
+    @staticmethod
+    def restore_copies(counts, batch_size=1000):
+        # Hot books get their copies back through Redis; the Book row is updated by InventoryDelta.flush.
+        hot = set()
+        if counts:
+            hot = set(Book.objects.filter(hot_inventory=True).values_list('pk', flat=True)) & counts.keys()
+        if hot:
+            InventoryDelta.restore({book_id: counts[book_id] for book_id in hot})
+        Book.add_copies({book_id: amount for book_id, amount in counts.items() if book_id not in hot}, batch_size)
+
+    @staticmethod
+    def add_copies(counts, batch_size=1000):
+        # One F() increment per book; books getting the same amount share a statement.
+        by_amount = defaultdict(list)
+        for book_id, amount in counts.items():
+            by_amount[amount].append(book_id)
+        for amount, book_ids in by_amount.items():
+            for i in range(0, len(book_ids), batch_size):
+                Book.objects.filter(pk__in=book_ids[i:i + batch_size]).update(
+                    available_copies=F('available_copies') + amount, updated_at=timezone.now()
+                )
+        if counts:
+            bump_versions('book')
+
     def __str__(self):
         return self.name
 
 
+# ---------------------------------------------  Trending ------------------------------------------------------- #
+class TrendingState(models.Model):
+    # Scores are stored relative to ``epoch``: a rental at time t adds 2 ** ((t - epoch) / half-life),
+    # so older rentals decay without ever rewriting them. renormalize() moves the epoch forward
+    # before the weights grow too large.
+    epoch = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Trending state'
+        verbose_name_plural = 'Trending state'
+
+    @classmethod
+    def current(cls):
+        state, _ = cls.objects.get_or_create(pk=1, defaults={'epoch': timezone.now()})
+        return state
+
+    def weight(self, at=None):
+        elapsed = ((at or timezone.now()) - self.epoch).total_seconds()
+        return 2 ** (elapsed / (settings.TRENDING_HALF_LIFE_HOURS * 3600))
+
+    @classmethod
+    def record(cls, book_ids):
+        # The epoch is read without a lock: reservations must not queue on this one row. If renormalize()
+        # commits in between, these few rentals are overweighted by at most one day's decay.
+        counts = Counter(book_ids)
+        if not counts:
+            return
+        weight = cls.current().weight()
+        by_amount = defaultdict(list)
+        for book_id, amount in counts.items():
+            by_amount[amount].append(book_id)
+        for amount, ids in by_amount.items():
+            Book.objects.filter(pk__in=ids).update(trending_score=F('trending_score') + weight * amount)
+
+    @classmethod
+    def renormalize(cls):
+        with transaction.atomic():
+            state = cls.objects.select_for_update().get(pk=cls.current().pk)
+            now = timezone.now()
+            factor = 1 / state.weight(now)
+            rows = Book.objects.filter(trending_score__gt=0).update(trending_score=F('trending_score') * factor)
+            state.epoch = now
+            state.save()
+        return rows
+
+
 # ---------------------------------------------  Basket ------------------------------------------------------- #
 class Basket(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -127,11 +233,38 @@ class Basket(models.Model):
     class Meta:
         verbose_name = 'Basket'
         verbose_name_plural = 'Baskets'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_basket_user_book'),
+        ]
+
+    @classmethod
+    def add_books(cls, user, book_ids):
+        # Three queries whatever the batch size; returns one status per requested book, in order.
+        book_ids = list(dict.fromkeys(book_ids))
+        found = set(Book.objects.filter(pk__in=book_ids).values_list('pk', flat=True))
+        present = set(cls.objects.filter(user=user, book_id__in=found).values_list('book_id', flat=True))
+        # A concurrent request may add the same book in between; the unique constraint makes that a no-op.
+        cls.objects.bulk_create([cls(user=user, book_id=book_id) for book_id in book_ids
+                                 if book_id in found and book_id not in present], ignore_conflicts=True)
+        results = []
+        for book_id in book_ids:
+            if book_id not in found:
+                results.append({'book': book_id, 'status': 'not_found', 'error': "Bunday kitob mavjud emas."})
+            elif book_id in present:
+                results.append({'book': book_id, 'status': 'exists',
+                                'error': "Siz bu kitobni allaqachon savatchaga qo'shgansiz."})
+            else:
+                results.append({'book': book_id, 'status': 'added'})
+        return results
 
     def __str__(self):
         return f"User - {self.user.email} Book - {self.book.name}"
 
 
+# Redis claims taken by Rental.reserve() inside Rental.reserving(), returned if that transaction rolls back.
+_reservation_claims = ContextVar('reservation_claims', default=None)
+
+
 # ---------------------------------------------  Rental ------------------------------------------------------- #
 class Rental(models.Model):
     STATUS_CHOICE = [
@@ -149,34 +282,307 @@ class Rental(models.Model):
     status = models.CharField(max_length=155, choices=STATUS_CHOICE, default='bron')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    penalty_accrued_on = models.DateField(blank=True, null=True)
+    # Reservation deadline: the (status, expires_at) index is the due queue drained by expire_reservations.
+    expires_at = models.DateTimeField(blank=True, null=True)
+
+    PENALTY_RATE = Decimal('0.01')
+    BRON_TTL = timedelta(days=1)
+    ACTIVE_STATUSES = ('bron', 'ijara')
+    CLOSED_STATUSES = ('qaytarilgan', 'bekor')
 
     class Meta:
         verbose_name = 'Rental'
         verbose_name_plural = 'Rentals'
-
-    def calculate_penalty(self):
-        if now().date() > self.end_date:
-            overdue_days = (now().date() - self.end_date).days
-            daily_penalty = self.book.daily_price * 0.01
-            self.penalty += daily_penalty * overdue_days
-            self.save()
+        indexes = [
+            models.Index(fields=['user', 'status'], name='rental_user_status_idx'),
+            models.Index(fields=['status', 'end_date'], name='rental_status_end_date_idx'),
+            models.Index(fields=['status', 'expires_at'], name='rental_status_expires_idx'),
+        ]
+        constraints = [
+            # reserve() skips books the user already has, but two concurrent requests both pass that check.
+            models.UniqueConstraint(fields=['user', 'book'], condition=Q(status__in=['bron', 'ijara']),
+                                    name='rental_one_active_per_book'),
+        ]
+
+    @classmethod
+    def accrue_penalties(cls, today=None, chunk_size=5000):
+        # Each overdue rental is charged for every day since it was last charged (or since it was due),
+        # and stamped with today, so a missed run is caught up while re-running the task on the same
+        # day (or a Celery retry) never double-charges.
+        today = today or timezone.localdate()
+        day_start = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        overdue = cls.objects.filter(status='ijara', end_date__lt=day_start).filter(
+            Q(penalty_accrued_on__isnull=True) | Q(penalty_accrued_on__lt=today)
+        )
+        daily_penalty = Subquery(Book.objects.filter(pk=OuterRef('book_id')).values('daily_price')[:1])
+
+        stats = []
+        bounds = overdue.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return stats
+
+        for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            started = time.monotonic()
+            chunk = overdue.filter(id__gte=start, id__lt=start + chunk_size)
+            rows = 0
+            with transaction.atomic():
+                # Rows are charged from the day they were last charged, or fell due, on. One UPDATE per
+                # such day, which for a daily run is just yesterday.
+                groups = [(Q(penalty_accrued_on=day), day)
+                          for day in chunk.exclude(penalty_accrued_on=None).dates('penalty_accrued_on', 'day')]
+                groups += [
+                    (Q(penalty_accrued_on=None, end_date__gte=day, end_date__lt=day + timedelta(days=1)), day.date())
+                    for day in chunk.filter(penalty_accrued_on=None).datetimes('end_date', 'day')
+                ]
+                for condition, since in groups:
+                    rows += chunk.filter(condition).update(
+                        penalty=F('penalty') + daily_penalty * (cls.PENALTY_RATE * (today - since).days),
+                        penalty_accrued_on=today,
+                        updated_at=timezone.now(),
+                    )
+                if rows:
+                    UserBalance.refresh(cls.objects.filter(
+                        id__gte=start, id__lt=start + chunk_size, status='ijara', penalty_accrued_on=today
+                    ).values_list('user_id', flat=True).distinct())
+            elapsed = time.monotonic() - started
+            stats.append({'start_id': start, 'rows': rows, 'elapsed': round(elapsed, 4)})
+            logger.info("Penalty chunk from id=%s: %s rows in %.3fs", start, rows, elapsed)
+        return stats
+
+    @classmethod
+    def archive_closed(cls, older_than=None, chunk_size=5000, start_id=None):
+        # Moves rentals closed longer than `older_than` to RentalArchive, one primary key range per
+        # transaction. Yields per-chunk stats; an interrupted run can resume from the last reported
+        # start_id, or simply start over, since archived rows are no longer in Rental.
+        older_than = older_than or timedelta(days=settings.RENTAL_ARCHIVE_AFTER_DAYS)
+        cutoff = timezone.now() - older_than
+        bounds = cls.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return
+        columns = [field.column for field in cls._meta.concrete_fields]
+        insert = "INSERT INTO {} ({}) ".format(
+            connection.ops.quote_name(RentalArchive._meta.db_table),
+            ', '.join(connection.ops.quote_name(column) for column in [*columns, 'archived_at']),
+        )
+        for start in range(max(start_id or 0, bounds['low']), bounds['high'] + 1, chunk_size):
+            started = time.monotonic()
+            with transaction.atomic():
+                ids = list(cls.objects.select_for_update().filter(
+                    id__gte=start, id__lt=start + chunk_size, status__in=cls.CLOSED_STATUSES, updated_at__lt=cutoff,
+                ).values_list('id', flat=True))
+                if ids:
+                    # INSERT ... SELECT: the rows are copied inside the database, never loaded into Python.
+                    rows = cls.objects.filter(pk__in=ids).values(*columns, archived_at=Value(timezone.now()))
+                    sql, params = rows.query.sql_with_params()
+                    with connection.cursor() as cursor:
+                        cursor.execute(insert + sql, params)
+                    cls.objects.filter(pk__in=ids).delete()
+            elapsed = time.monotonic() - started
+            logger.info("Archive chunk from id=%s: %s rows in %.3fs", start, len(ids), elapsed)
+            yield {'start_id': start, 'rows': len(ids), 'elapsed': round(elapsed, 4)}
+
+    @property
+    def bron_deadline(self):
+        # Rentals reserved before expires_at existed fall back to created_at + BRON_TTL.
+        return self.expires_at or self.created_at + self.BRON_TTL
 
     def cancel_bron(self):
-        if self.status == 'bron' and timezone.now() > self.created_at + timedelta(days=1):
+        if self.status == 'bron' and timezone.now() > self.bron_deadline:
             self.status = 'bekor'
-            self.book.available_copies += 1
-            self.book.save()
-            self.save()
+            with transaction.atomic():
+                Book.restore_copies({self.book_id: 1})
+                self.save(update_fields=['status', 'updated_at'])
+
+    @classmethod
+    def expire_reservations(cls, chunk_size=5000):
+        # Drains only what is due from the (status, expires_at) index: O(due), not O(reservations).
+        started = time.monotonic()
+        now = timezone.now()
+        due = cls.objects.filter(
+            Q(status='bron', expires_at__lte=now) |
+            Q(status='bron', expires_at__isnull=True, created_at__lte=now - cls.BRON_TTL)
+        )
+        restored = Counter()
+        user_ids = set()
+        max_lag = 0.0
+        with transaction.atomic():
+            while True:
+                chunk = list(
+                    due.select_for_update().order_by('id')
+                    .values_list('id', 'book_id', 'user_id', 'expires_at', 'created_at')[:chunk_size]
+                )
+                if not chunk:
+                    break
+                cls.objects.filter(pk__in=[row[0] for row in chunk]).update(status='bekor', updated_at=now)
+                restored.update(row[1] for row in chunk)
+                user_ids.update(row[2] for row in chunk)
+                oldest = min(expires_at or created_at + cls.BRON_TTL for _, _, _, expires_at, created_at in chunk)
+                max_lag = max(max_lag, (now - oldest).total_seconds())
+                if len(chunk) < chunk_size:
+                    break
+            Book.restore_copies(restored)
+            UserBalance.refresh(user_ids)
+        elapsed = time.monotonic() - started
+        expired = sum(restored.values())
+        metrics.record_expiry(expired, max_lag)
+        logger.info("Expired %s reservations across %s books in %.3fs (max lag %.1fs)",
+                    expired, len(restored), elapsed, max_lag)
+        return {'rentals': expired, 'books': len(restored), 'max_lag': round(max_lag, 3), 'elapsed': round(elapsed, 4)}
+
+    @classmethod
+    @contextmanager
+    def reserving(cls):
+        """Transaction for callers that do more work around reserve().
+
+        reserve() gives its Redis claims back only when its own block fails; Django 4.2 has no on_rollback
+        hook, so a rollback of the caller's transaction would leave them held until reconcile. Claims taken
+        inside this block are released when it rolls back. Nested in an outer atomic block (ATOMIC_REQUESTS,
+        benchmark_endpoints), committing here only releases a savepoint and the claims belong to the outer
+        transaction: they settle when it commits, and if it rolls back, reconcile returns them once they are
+        TOKEN_TIMEOUT old.
+        """
+        claims = {}
+        token = _reservation_claims.set(claims)
+        try:
+            with transaction.atomic():
+                yield
+                rolled_back = transaction.get_rollback()
+        except BaseException:
+            inventory.release(claims)
+            raise
+        finally:
+            _reservation_claims.reset(token)
+        if rolled_back:
+            inventory.release(claims)
+
+    @classmethod
+    def reserve(cls, user, books):
+        # Stock is claimed with conditional atomic decrements (in Redis for hot books), so a copy
+        # can never be oversold.
+        books = list({book.pk: book for book in books}.values())
+        taken = set(
+            cls.objects.filter(user=user, book__in=books, status__in=cls.ACTIVE_STATUSES).values_list('book_id', flat=True)
+        )
+        claims = InventoryDelta.claim([book for book in books if book.hot_inventory and book.pk not in taken])
+        pending = _reservation_claims.get()
+        if pending is not None:
+            pending.update(claims)
+        reserved, errors, deltas = [], [], []
+        try:
+            with transaction.atomic():
+                for book in books:
+                    if book.pk in taken:
+                        errors.append({'book': book.pk, 'error': f"'{book.name}' kitobi allaqachon sizda ijarada."})
+                        continue
+                    if book.hot_inventory:
+                        claimed = book.pk in claims
+                        if claimed:
+                            deltas.append(InventoryDelta(book=book, delta=-1, token=claims[book.pk]))
+                    else:
+                        claimed = Book.objects.filter(pk=book.pk, available_copies__gt=0).update(
+                            available_copies=F('available_copies') - 1, updated_at=timezone.now()
+                        )
+                    if not claimed:
+                        errors.append({'book': book.pk, 'error': f"'{book.name}' kitobi hozircha mavjud emas."})
+                        continue
+                    reserved.append(cls(user=user, book=book, expires_at=timezone.now() + cls.BRON_TTL))
+                cls.objects.bulk_create(reserved)
+                InventoryDelta.objects.bulk_create(deltas)
+                if reserved:
+                    UserBalance.refresh([user.pk])
+                if claims:
+                    transaction.on_commit(lambda: inventory.settle(claims))
+        except Exception:
+            inventory.release(claims)
+            raise
+        if reserved:
+            bump_versions('book')
+        return reserved, errors
+
+    def save(self, *args, **kwargs):
+        if self.status == 'bron' and self.expires_at is None:
+            self.expires_at = timezone.now() + self.BRON_TTL
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            UserBalance.refresh([self.user_id])
 
     @staticmethod
     def calculate_user_debt(user):
-        debt = Rental.objects.filter(user=user, status='ijara').aggregate(total_penalty=Sum('penalty'))['total_penalty']
+        debt = UserBalance.objects.filter(user=user).values_list('debt', flat=True).first()
         return debt or 0
 
     def __str__(self):
         return f"User - {self.user.email} Book - {self.book.name} Status - {self.status}"
 
 
+# ---------------------------------------------  Rental archive ------------------------------------------------------- #
+class RentalArchive(models.Model):
+    # Closed rentals moved out of Rental by Rental.archive_closed, keeping their original ids,
+    # so the rental history reads both tables as one id-ordered list.
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    start_date = models.DateTimeField(blank=True, null=True)
+    end_date = models.DateTimeField(blank=True, null=True)
+    penalty = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    status = models.CharField(max_length=155, choices=Rental.STATUS_CHOICE)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    penalty_accrued_on = models.DateField(blank=True, null=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Rental archive'
+        verbose_name_plural = 'Rental archive'
+        indexes = [
+            models.Index(fields=['user', 'id'], name='rental_archive_user_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"User - {self.user_id} Book - {self.book_id} Status - {self.status}"
+
+
+# ---------------------------------------------  UserBalance ------------------------------------------------------- #
+class UserBalance(models.Model):
+    # Denormalized per-user totals over Rental, so the reservation check is a primary key lookup.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='balance')
+    debt = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    active_rentals = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'User balance'
+        verbose_name_plural = 'User balances'
+
+    @staticmethod
+    def totals(user_ref):
+        rentals = Rental.objects.filter(user=OuterRef(user_ref)).order_by().values('user')
+        return {
+            'debt': Coalesce(
+                Subquery(rentals.filter(status='ijara').annotate(total=Sum('penalty')).values('total')),
+                Value(Decimal('0')),
+            ),
+            'active_rentals': Coalesce(
+                Subquery(rentals.filter(status__in=Rental.ACTIVE_STATUSES).annotate(total=Count('id')).values('total')),
+                Value(0),
+            ),
+        }
+
+    @classmethod
+    def refresh(cls, user_ids, batch_size=1000):
+        # Recomputes the totals from Rental for the given users inside the caller's transaction.
+        user_ids = list(set(user_ids))
+        for i in range(0, len(user_ids), batch_size):
+            batch = user_ids[i:i + batch_size]
+            cls.objects.bulk_create([cls(user_id=user_id) for user_id in batch], ignore_conflicts=True)
+            cls.objects.filter(user_id__in=batch).update(**cls.totals('user_id'), updated_at=timezone.now())
+
+    def __str__(self):
+        return f"User - {self.user_id} Debt - {self.debt} Active - {self.active_rentals}"
+
+
 # ---------------------------------------------  Assessment ------------------------------------------------------- #
 class Assessment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -190,3 +596,151 @@ class Assessment(models.Model):
 
     def __str__(self):
         return f"{self.user.email} Book - {self.book.name} Rating - {self.rating}"
+
+
+# ---------------------------------------------  Hot inventory ------------------------------------------------------- #
+class InventoryDelta(models.Model):
+    # Committed stock changes of hot books. Redis decides whether a copy can be reserved; these rows carry
+    # the change to Book.available_copies (flush) and tell reconcile which Redis tokens committed.
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    delta = models.IntegerField()
+    token = models.UUIDField(unique=True)
+    applied = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Longest a reserving/restoring transaction may stay open; older unsettled tokens are treated as rolled back.
+    TOKEN_TIMEOUT = 60
+    APPLIED_RETENTION = timedelta(days=1)
+
+    class Meta:
+        verbose_name = 'Inventory delta'
+        verbose_name_plural = 'Inventory deltas'
+        indexes = [
+            models.Index(fields=['applied', 'book'], name='inventory_applied_book_idx'),
+            models.Index(fields=['applied', 'created_at'], name='inventory_applied_created_idx'),
+        ]
+
+    @classmethod
+    def claim(cls, books):
+        # Returns {book_id: token} for the books a copy was claimed for.
+        tokens = {book.pk: str(uuid.uuid4()) for book in books}
+        if not tokens:
+            return {}
+        results = inventory.claim(tokens)
+        missing = [book_id for book_id, result in results.items() if result == -1]
+        if missing:
+            # The counters were lost (e.g. a Redis restart): load them from the database and retry.
+            cls.reconcile(missing)
+            results.update(inventory.claim({book_id: tokens[book_id] for book_id in missing}))
+        return {book_id: tokens[book_id] for book_id, result in results.items() if result == 1}
+
+    @classmethod
+    def restore(cls, counts):
+        tokens = {book_id: str(uuid.uuid4()) for book_id in counts}
+        inventory.expect_restores(tokens)
+        cls.objects.bulk_create([cls(book_id=book_id, delta=counts[book_id], token=token)
+                                 for book_id, token in tokens.items()])
+        transaction.on_commit(lambda: inventory.add({
+            book_id: (token, counts[book_id]) for book_id, token in tokens.items()
+        }))
+
+    @classmethod
+    def flush(cls, batch_size=5000):
+        # Writes committed deltas back to Book.available_copies, marking them applied in the same transaction.
+        applied = 0
+        while True:
+            with transaction.atomic():
+                rows = list(cls.objects.select_for_update().filter(applied=False).order_by('id')
+                            .values_list('id', 'book_id', 'delta')[:batch_size])
+                totals = Counter()
+                for _, book_id, delta in rows:
+                    totals[book_id] += delta
+                Book.add_copies({book_id: amount for book_id, amount in totals.items() if amount})
+                cls.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(applied=True)
+            applied += len(rows)
+            if len(rows) < batch_size:
+                break
+        cls.objects.filter(applied=True, created_at__lt=timezone.now() - cls.APPLIED_RETENTION).delete()
+        return applied
+
+    @classmethod
+    def committed_tokens(cls, tokens):
+        return {str(token) for token in cls.objects.filter(token__in=list(tokens)).values_list('token', flat=True)}
+
+    @classmethod
+    def reconcile(cls, book_ids=None):
+        """Resets each hot book's Redis counter from the database: available copies plus unapplied deltas,
+        minus claims still in flight. Returns {book_id: stock}.
+
+        The queries are ordered so that a transaction committing concurrently can only make the counter
+        too low, never too high: claims are checked before the stock is read, restores after it.
+        """
+        if book_ids is None:
+            book_ids = list(Book.objects.filter(hot_inventory=True).values_list('pk', flat=True))
+        stock = {}
+        for book_id in book_ids:
+            claims, restores = inventory.pending(book_id)
+            expired = time.time() - cls.TOKEN_TIMEOUT
+            committed = cls.committed_tokens(claims)
+            in_flight = [token for token, at in claims.items() if token not in committed and at >= expired]
+
+            book = Book.objects.filter(pk=book_id).annotate(
+                pending=Coalesce(Sum('inventorydelta__delta', filter=Q(inventorydelta__applied=False)), Value(0))
+            ).values_list('available_copies', 'pending').first()
+            if book is None:
+                inventory.forget([book_id])
+                continue
+            available, unapplied = book
+
+            committed_restores = cls.committed_tokens(restores)
+            inventory.drop(
+                book_id,
+                claims=[token for token in claims if token not in in_flight],
+                restores=[token for token, at in restores.items() if token not in committed_restores and at < expired],
+            )
+            stock[book_id] = inventory.reset(book_id, available + unapplied - len(in_flight), list(claims),
+                                             committed_restores)
+        return stock
+
+
+# ---------------------------------------------  Recommendations ------------------------------------------------------- #
+class BookRecommendation(models.Model):
+    # "Readers who rented this also rented": the top neighbors from the co-rental model (book.recommendations),
+    # precomputed so serving is a primary key lookup.
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='recommendation')
+    neighbors = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    REBUILD_LOCK_TIMEOUT = 6 * 60 * 60
+
+    class Meta:
+        verbose_name = 'Book recommendation'
+        verbose_name_plural = 'Book recommendations'
+
+    @classmethod
+    def rebuild(cls, full=False, batch_size=1000):
+        # Folds rentals made since the last run into the model and re-ranks only the books they touched.
+        lock_key = 'recommendations_rebuild_lock'
+        if not cache.add(lock_key, 1, timeout=cls.REBUILD_LOCK_TIMEOUT):
+            logger.info("Recommendations rebuild is already running")
+            return None
+        try:
+            started = time.monotonic()
+            matrix, changed, stats = recommendations.update(
+                [Rental.objects.order_by(), RentalArchive.objects.order_by()], Book.objects.all(), full=full
+            )
+            for i in range(0, len(changed), batch_size):
+                neighbors = recommendations.top_neighbors(matrix, changed[i:i + batch_size],
+                                                          settings.RECOMMENDATIONS_TOP_K)
+                existing = Book.objects.filter(pk__in=list(neighbors)).values_list('pk', flat=True)
+                cls.objects.bulk_create(
+                    [cls(book_id=pk, neighbors=neighbors[pk]) for pk in existing],
+                    update_conflicts=True, unique_fields=['book'], update_fields=['neighbors', 'updated_at'],
+                )
+            stats['elapsed'] = round(time.monotonic() - started, 4)
+            return stats
+        finally:
+            cache.delete(lock_key)
+
+    def __str__(self):
+        return f"Book - {self.book_id} Neighbors - {len(self.neighbors)}"
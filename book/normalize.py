@@ -0,0 +1,25 @@
+import re
+from functools import lru_cache
+
+from unidecode import unidecode
+
+NOT_ALLOWED = re.compile(r"[^a-z0-9\s]")
+WHITESPACE = re.compile(r"\s+")
+
+# Official Uzbek Latin for letters unidecode romanizes differently (Ў -> U, Қ -> K', Ҳ -> Kh').
+# Ё/Ю/Я follow the same Yo/Yu/Ya spelling used in Uzbek and common Russian romanization.
+CYRILLIC = str.maketrans({
+    'Ў': "O'", 'ў': "o'", 'Қ': 'Q', 'қ': 'q', 'Ғ': "G'", 'ғ': "g'", 'Ҳ': 'H', 'ҳ': 'h',
+    'Ё': 'Yo', 'ё': 'yo', 'Ю': 'Yu', 'ю': 'yu', 'Я': 'Ya', 'я': 'ya',
+})
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(value):
+    """Searchable form of a title, name or query: 'Ўткан кунлар', "O‘tkan  kunlar!" -> 'otkan kunlar'.
+
+    Non-Latin scripts are transliterated instead of dropped, so Cyrillic titles stay searchable
+    and a Cyrillic query finds the Latin spelling too.
+    """
+    value = NOT_ALLOWED.sub('', unidecode(value.translate(CYRILLIC)).lower())
+    return WHITESPACE.sub(' ', value).strip()
@@ -0,0 +1,59 @@
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    # Keyset pagination on the primary key: every page is an indexed range scan, no OFFSET.
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class LatestCursorPagination(IdCursorPagination):
+    ordering = '-id'
+
+
+class MergedLatestCursorPagination(LatestCursorPagination):
+    """Newest-first pages over several values() querysets whose ids never overlap (Rental and RentalArchive).
+
+    Each page reads at most page_size + 1 rows per queryset below (or above) the cursor id and merges them,
+    so a page costs one short index range scan per table. Cursors have the same format as
+    LatestCursorPagination's, so links issued before the merge keep working.
+    """
+
+    def paginate_querysets(self, querysets, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor.reverse)
+        try:
+            position = int(cursor.position) if cursor and cursor.position is not None else None
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+        rows = []
+        for queryset in querysets:
+            if position is not None:
+                queryset = queryset.filter(id__gt=position) if reverse else queryset.filter(id__lt=position)
+            rows.extend(queryset.order_by('id' if reverse else '-id')[:self.page_size + 1])
+        rows.sort(key=lambda row: row['id'], reverse=not reverse)
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.page[-1]['id']))
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.page[0]['id']))
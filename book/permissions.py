@@ -7,3 +7,8 @@ class IsAmin(permissions.BasePermission):
             return True
         if request.method in permissions.SAFE_METHODS:
             return True
+
+
+class IsAdminRole(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.role == 'admin'
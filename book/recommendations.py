@@ -0,0 +1,159 @@
+"""Item-item co-rental model behind "readers who rented this also rented ...".
+
+X is the binary reader x book matrix of rental history (Rental and RentalArchive) and C = X^T X:
+C[i, j] counts readers who rented both i and j, the diagonal how many rented i. Neighbors are ranked
+by cosine similarity C[i, j] / sqrt(C[i, i] * C[j, j]), so bestsellers do not top every list.
+
+C = sum over readers of x^T x, so an update only replaces the terms of readers with new rentals:
+C += X_new^T X_new - X_old^T X_old over those readers. C is saved to an .npz file together with the
+last rental id it covers; each run reads only the history of readers who rented since then.
+
+Every rental counts, whatever its status: statuses change later (bron -> bekor), and the old terms
+must be computed from exactly the rows that built them. Only a reader's RECOMMENDATIONS_USER_HISTORY
+most recent books count, so a handful of very heavy readers cannot make C dense. Rentals deleted
+outright (a cancelled bron) keep counting until the next full rebuild.
+"""
+import logging
+import os
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+
+def load(path=None):
+    # (C, last rental id), or (None, 0) if nothing was built yet.
+    path = path or settings.RECOMMENDATIONS_MATRIX_PATH
+    if not os.path.exists(path):
+        return None, 0
+    with np.load(path) as stored:
+        matrix = sparse.csr_matrix(
+            (stored['data'], stored['indices'], stored['indptr']), shape=tuple(stored['shape'])
+        )
+        return matrix, int(stored['last_rental_id'])
+
+
+def save(matrix, last_rental_id, path=None):
+    # Written next to the target and renamed, so a crash never leaves a half-written model behind.
+    path = path or settings.RECOMMENDATIONS_MATRIX_PATH
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as file:
+        np.savez(file, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                 shape=np.array(matrix.shape), last_rental_id=np.array(last_rental_id))
+    os.replace(tmp, path)
+
+
+def last_rental_id(querysets):
+    return max(queryset.aggregate(last=Max('id'))['last'] or 0 for queryset in querysets)
+
+
+def readers_since(querysets, last_id, high):
+    user_ids = set()
+    for queryset in querysets:
+        user_ids.update(queryset.filter(id__gt=last_id, id__lte=high).values_list('user_id', flat=True).distinct())
+    return sorted(user_ids)
+
+
+def history(querysets, user_ids, high):
+    # (user, book, rental id) arrays for the readers' rentals up to `high`.
+    rows = []
+    for queryset in querysets:
+        rows.extend(queryset.filter(user_id__in=user_ids, id__lte=high).values_list('user_id', 'book_id', 'id'))
+    if not rows:
+        return (np.empty(0, dtype=np.int64),) * 3
+    users, books, ids = np.array(rows, dtype=np.int64).T
+    return users, books, ids
+
+
+def gram(users, books, ids, up_to, shape, limit):
+    """X^T X for the given rentals with id <= up_to: each reader's `limit` most recently rented books."""
+    mask = ids <= up_to
+    users, books, ids = users[mask], books[mask], ids[mask]
+    # Newest first within each reader, then keep the newest rental of every (reader, book).
+    order = np.lexsort((-ids, users))
+    users, books = users[order], books[order]
+    _, first = np.unique(users * shape + books, return_index=True)
+    first.sort()
+    users, books = users[first], books[first]
+    rank = np.arange(len(users)) - np.searchsorted(users, users)
+    users, books = users[rank < limit], books[rank < limit]
+
+    _, rows = np.unique(users, return_inverse=True)
+    x = sparse.csr_matrix(
+        (np.ones(len(books), dtype=np.int32), (rows, books)), shape=(rows.max() + 1 if len(rows) else 0, shape)
+    )
+    return (x.T @ x).tocsr()
+
+
+def change(histories, last_id, high, shape, limit=None):
+    """Change to C from rentals last_id < id <= high; `histories` yields the affected readers' full histories."""
+    limit = limit or settings.RECOMMENDATIONS_USER_HISTORY
+    delta = sparse.csr_matrix((shape, shape), dtype=np.int32)
+    for users, books, ids in histories:
+        delta += gram(users, books, ids, high, shape, limit) - gram(users, books, ids, last_id, shape, limit)
+    delta.eliminate_zeros()
+    return delta
+
+
+def stale_rows(matrix, delta):
+    """Books whose neighbor ranking may change when `delta` is added to C (`matrix` already includes it).
+
+    Scores divide by each neighbor's reader count C[j, j], so besides the rows that changed, every row next
+    to a book that gained or lost readers is re-ranked; C is symmetric, so row j lists those books.
+    """
+    recounted = np.flatnonzero(delta.diagonal())
+    return np.union1d(np.flatnonzero(np.diff(delta.indptr)), matrix[recounted].indices)
+
+
+def update(querysets, books, full=False, batch_size=500, path=None):
+    """Adds the rentals in `querysets` made since the last run to C; `books` is the Book queryset.
+
+    Returns (C, ids of the books whose row of C changed, stats); `full` rebuilds C from scratch.
+    """
+    matrix, last_id = (None, 0) if full else load(path)
+    high = last_rental_id(querysets)
+    # Sized after reading `high`: every rental up to it refers to a book id below the shape.
+    last_book_id = books.aggregate(last=Max('id'))['last'] or 0
+    shape = max(last_book_id + 1, matrix.shape[0] if matrix is not None else 0)
+    if matrix is None:
+        matrix = sparse.csr_matrix((shape, shape), dtype=np.int32)
+    elif matrix.shape[0] < shape:
+        matrix.resize((shape, shape))
+
+    readers = readers_since(querysets, last_id, high)
+    delta = change((history(querysets, readers[i:i + batch_size], high) for i in range(0, len(readers), batch_size)),
+                   last_id, high, shape)
+    matrix = (matrix + delta).tocsr()
+    matrix.eliminate_zeros()
+    save(matrix, high, path)
+
+    changed = np.flatnonzero(np.diff(matrix.indptr)) if full else stale_rows(matrix, delta)
+    stats = {'readers': len(readers), 'from_rental_id': last_id, 'to_rental_id': high, 'pairs': int(matrix.nnz),
+             'changed_books': len(changed)}
+    logger.info("Co-rental matrix updated: %s", stats)
+    return matrix, changed, stats
+
+
+def top_neighbors(matrix, book_ids, k):
+    """{book_id: [neighbor ids, best first]} by cosine similarity, for the given rows of C."""
+    counts = matrix.diagonal().astype(np.float64)
+    neighbors = {}
+    for book_id in book_ids:
+        start, end = matrix.indptr[book_id], matrix.indptr[book_id + 1]
+        columns, together = matrix.indices[start:end], matrix.data[start:end]
+        keep = columns != book_id
+        columns, together = columns[keep], together[keep]
+        if not len(columns):
+            neighbors[int(book_id)] = []
+            continue
+        scores = together / np.sqrt(counts[book_id] * counts[columns])
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            columns, scores = columns[best], scores[best]
+        # Ties go to the lower id, so lists are stable between runs.
+        order = np.lexsort((columns, -scores))
+        neighbors[int(book_id)] = columns[order].tolist()
+    return neighbors
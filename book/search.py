@@ -0,0 +1,113 @@
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Q
+
+FTS_TABLE = 'book_search_fts'
+
+# bm25() column weights: book name, author name, genre name
+COLUMN_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def is_enabled(using=DEFAULT_DB_ALIAS):
+    return settings.BOOK_SEARCH_FTS and connections[using].vendor == 'sqlite'
+
+
+def create_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    if not is_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(name, author, genre, tokenize='unicode61')"
+        )
+
+
+def _select_documents(where):
+    book = apps.get_model('book', 'Book')._meta.db_table
+    author = apps.get_model('book', 'Author')._meta.db_table
+    genre = apps.get_model('book', 'Genre')._meta.db_table
+    return (
+        f"SELECT b.id, b.cleaned_name, a.cleaned_name, g.cleaned_name FROM {book} b "
+        f"JOIN {author} a ON a.id = b.author_id JOIN {genre} g ON g.id = b.genre_id WHERE {where}"
+    )
+
+
+def _index(where, params):
+    if not is_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, author, genre) {_select_documents(where)}", params
+        )
+        return cursor.rowcount
+
+
+def index_book(book_id):
+    return _index('b.id = %s', [book_id])
+
+
+def index_author_books(author_id):
+    return _index('b.author_id = %s', [author_id])
+
+
+def index_genre_books(genre_id):
+    return _index('b.genre_id = %s', [genre_id])
+
+
+def index_book_range(start, stop):
+    return _index('b.id >= %s AND b.id < %s', [start, stop])
+
+
+def remove_book(book_id):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+
+
+def book_deleted(sender, instance, **kwargs):
+    # Also sent for queryset deletes and for books removed with their author or genre.
+    remove_book(instance.pk)
+
+
+def rebuild_index(chunk_size=10000):
+    book_table = apps.get_model('book', 'Book')._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    create_index()
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(id), MAX(id) FROM {book_table}")
+        low, high = cursor.fetchone()
+    if low is None:
+        return
+    for start in range(low, high + 1, chunk_size):
+        with transaction.atomic():
+            rows = index_book_range(start, start + chunk_size)
+        yield start, rows
+
+
+def fallback_filter(query):
+    # Book filter used while the index is off. The sync and async search views share cache keys,
+    # so both must use exactly this filter.
+    return Q(cleaned_name__icontains=query) | Q(author__cleaned_name__icontains=query) | \
+        Q(genre__cleaned_name__icontains=query)
+
+
+def match_expression(query):
+    # Every term must match, each as a prefix, in any of the indexed columns.
+    return ' '.join(f'"{term}"*' for term in query.split())
+
+
+def search_book_ids(query, limit=None):
+    expression = match_expression(query)
+    if not expression:
+        return []
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s",
+            [expression, limit or settings.BOOK_SEARCH_LIMIT],
+        )
+        return [row[0] for row in cursor.fetchall()]
@@ -1,9 +1,11 @@
 from datetime import timedelta
+from decimal import Decimal
 
+from django.conf import settings
 from django.utils import timezone
-from rest_framework.fields import IntegerField, DateTimeField
+from rest_framework.fields import IntegerField, DateTimeField, ListField
 from rest_framework.relations import PrimaryKeyRelatedField
-from rest_framework.serializers import ModelSerializer, SerializerMethodField, ValidationError
+from rest_framework.serializers import ModelSerializer, Serializer, SerializerMethodField, ValidationError
 
 from book.models import Book, Genre, Author, Basket, Assessment, Rental, User
 
@@ -41,7 +43,10 @@ class GenreBookSerializer(ModelSerializer):
         fields = ['name', 'books']
 
     def get_books(self, obj):
-        books = Book.objects.filter(genre_id=obj)
+        # The view passes in the current page of books; fall back to the full list otherwise.
+        books = self.context.get('books')
+        if books is None:
+            books = Book.objects.filter(genre=obj).select_related('author', 'genre')
         return BookSerializer(books, many=True).data
 
 
@@ -61,7 +66,10 @@ class AuthorBookSerializer(ModelSerializer):
         fields = ['name', 'books']
 
     def get_books(self, obj):
-        books = Book.objects.filter(author_id=obj)
+        # The view passes in the current page of books; fall back to the full list otherwise.
+        books = self.context.get('books')
+        if books is None:
+            books = Book.objects.filter(author=obj).select_related('author', 'genre')
         return BookSerializer(books, many=True).data
 
 
@@ -73,13 +81,9 @@ class BasketSerializer(ModelSerializer):
         fields = ['user', 'book']
         read_only_fields = ['user']
 
-    def validate(self, data):
-        user = self.context['request'].user
-        book = data['book']
-        if Basket.objects.filter(user=user, book=book).exists():
-            raise ValidationError("Siz bu kitobni allaqachon savatchaga qo'shgansiz.")
 
-        return data
+class BasketBatchSerializer(Serializer):
+    books = ListField(child=IntegerField(min_value=1), allow_empty=False, max_length=settings.BASKET_BATCH_LIMIT)
 
 
 # -------------------------------------------------------------------------------------------------------------- #
@@ -98,19 +102,15 @@ class AssessmentSerializer(ModelSerializer):
 
 class BookReviewsSerializer(ModelSerializer):
     book = PrimaryKeyRelatedField(queryset=Book.objects.all())
-    all = SerializerMethodField()
 
     class Meta:
         model = Assessment
-        fields = ['book', 'rating', 'comment', 'all']
-
-    def get_all(self, obj):
-        alls = Assessment.objects.filter(book_id=obj)
-        return AssessmentSerializer(alls, many=True).data
+        fields = ['book', 'rating', 'comment']
 
     def to_representation(self, instance):
-        representation = uper().to_representation(instance)
+        representation = super().to_representation(instance)
         representation['book'] = instance.book.name
+        return representation
 
 
 # -------------------------------------------------------------------------------------------------------------- #
@@ -128,25 +128,6 @@ class RentalSerializer(ModelSerializer):
         return representation
 
 
-class RentalCreateSerializer(ModelSerializer):
-    class Meta:
-        model = Rental
-        fields = ['book']
-
-    def validate(self, data):
-        user = self.context['request'].user
-        if not user.is_authenticated:
-            raise ValidationError("Foydalanuvchi autentifikatsiyadan o'tmagan")
-
-        if Rental.calculate_user_debt(user) > 0:
-            raise ValidationError("Sizda qarzdorlik bo'lgani uchun kitob bron qilolmaysiz.")
-
-        if Rental.objects.filter(user=user, book=data['book']).exists():
-            raise ValidationError(f"'{data['book'].name}' kitobi allaqachon sizda ijarada.")
-
-        return data
-
-
 class RentalUpdateSerializer(ModelSerializer):
     id = IntegerField(write_only=True)
     start_date = DateTimeField(read_only=True)
@@ -211,3 +192,76 @@ class SearchSerializer(ModelSerializer):
     class Meta:
         model = Book
         fields = ['name', 'author', 'genre', 'available_copies']
+
+
+# ----------------------------------------  Read-only fast path  ---------------------------------------------- #
+# Hot list endpoints skip the per-field DRF machinery: rows come straight from .values() and are
+# projected into the exact dicts the ModelSerializers above produce.
+
+CENT = Decimal('0.01')
+
+
+def decimal_string(value):
+    # DecimalField(decimal_places=2) with COERCE_DECIMAL_TO_STRING.
+    return None if value is None else f"{value.quantize(CENT):f}"
+
+
+def datetime_string(value, tz):
+    # DateTimeField in ISO 8601, converted to the current timezone (`tz`) like DRF does.
+    if not value:
+        return None
+    if value.tzinfo is not tz:
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class BookRowSerializer:
+    """Same output as BookSerializer(many=True) for rows from BookRowSerializer.values(queryset)."""
+
+    lookups = ('id', 'name', 'description', 'author__name', 'genre__name', 'daily_price', 'available_copies',
+               'is_available')
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*cls.lookups)
+
+    @property
+    def data(self):
+        return [{
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'author': row['author__name'],
+            'genre': row['genre__name'],
+            'daily_price': decimal_string(row['daily_price']),
+            'available_copies': row['available_copies'],
+            'is_available': row['is_available'],
+        } for row in self.rows]
+
+
+class RentalRowSerializer:
+    """Same output as RentalSerializer(many=True); `id` is selected only for cursor pagination."""
+
+    lookups = ('id', 'book__name', 'start_date', 'end_date', 'status', 'penalty')
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*cls.lookups)
+
+    @property
+    def data(self):
+        tz = timezone.get_current_timezone()
+        return [{
+            'book': row['book__name'],
+            'start_date': datetime_string(row['start_date'], tz),
+            'end_date': datetime_string(row['end_date'], tz),
+            'status': row['status'],
+            'penalty': decimal_string(row['penalty']),
+        } for row in self.rows]
@@ -1,19 +1,57 @@
 # from celery import shared_task
-from .models import Rental
-from django.utils import timezone
+from celery.signals import worker_ready
+
+from .models import BookRecommendation, InventoryDelta, Rental, TrendingState
 from config.celery import app
 
-@app
+
+@app.task
 def calculate_penalties():
+    stats = Rental.accrue_penalties()
+    return {
+        'rows': sum(chunk['rows'] for chunk in stats),
+        'chunks': len(stats),
+        'elapsed': round(sum(chunk['elapsed'] for chunk in stats), 4),
+    }
 
-    now = timezone.now()
-    rentals = Rental.objects.filter(status='ijara')
-    for rental in rentals:
-        rental.calculate_penalty()
 
-@app
+@app.task
 def cancel_bron_if_not_collected():
-    rentals = Rental.objects.filter(status='bron')
+    return Rental.expire_reservations()
+
+
+@app.task
+def archive_closed_rentals():
+    stats = list(Rental.archive_closed())
+    return {
+        'rows': sum(chunk['rows'] for chunk in stats),
+        'chunks': len(stats),
+        'elapsed': round(sum(chunk['elapsed'] for chunk in stats), 4),
+    }
+
+
+@app.task
+def rebuild_recommendations():
+    return BookRecommendation.rebuild()
+
+
+@app.task
+def renormalize_trending_scores():
+    return TrendingState.renormalize()
+
+
+@app.task
+def flush_hot_inventory():
+    return InventoryDelta.flush()
+
+
+@app.task
+def reconcile_hot_inventory():
+    return InventoryDelta.reconcile()
+
 
-    for rental in rentals:
-        rental.cancel_bron()
+@worker_ready.connect
+def reconcile_hot_inventory_on_startup(**kwargs):
+    # Counters may be stale after a crash or a Redis restart; rebuild them before serving tasks.
+    InventoryDelta.flush()
+    InventoryDelta.reconcile()
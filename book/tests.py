@@ -1,3 +1,1514 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import re
+import tempfile
+import time
+import unittest
+import uuid
+import warnings
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from book import export, inventory, metrics, recommendations, routers, search
+from book.authentication import CachedTokenAuthentication, local_cache, user_key
+from book.cache import get_counters, get_or_compute
+from book.importer import CatalogImporter, CatalogImportError, read_rows
+from book.middleware import PerformanceMiddleware, ReplicaRoutingMiddleware
+from book.normalize import normalize_name
+from book.models import Assessment, Author, Basket, Book, BookRecommendation, Genre, InventoryDelta, Rental, \
+    RentalArchive, TrendingState, User, UserBalance
+from book.renderers import ORJSONRenderer
+from book.routers import PrimaryReplicaRouter
+from book.serializer import BookSerializer, RentalSerializer
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class CatalogFixtureMixin:
+    """The catalog most tests need: a reader, one author and one genre, plus factories for books and readers."""
+
+    role = 'user'
+
+    @classmethod
+    def create_catalog(cls):
+        cls.user = User.objects.create_user(email='reader@example.com', password='secret', role=cls.role)
+        cls.author = Author.objects.create(name='Abdulla Qodiriy')
+        cls.genre = Genre.objects.create(name='Roman')
+
+    @classmethod
+    def create_book(cls, name='Otkan kunlar', **fields):
+        fields = {'description': 'Tavsif', 'daily_price': Decimal('5000.00'), 'available_copies': 1, **fields}
+        return Book.objects.create(name=name, author=cls.author, genre=cls.genre, **fields)
+
+    @staticmethod
+    def create_readers(count):
+        return [User.objects.create_user(email=f'reader{number}@example.com', password='secret')
+                for number in range(count)]
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogTestCase(CatalogFixtureMixin, APITestCase):
+    """Runs on a local-memory cache (cleared per test) with the client authenticated as the reader."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+
+class PenaltyAccrualTests(CatalogTestCase):
+    TODAY = date(2026, 3, 10)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.books = [cls.create_book(f'Kitob {number}', daily_price=Decimal('1000.00')) for number in range(5)]
+
+    def rent(self, book, due, **fields):
+        end_date = timezone.make_aware(datetime.combine(due, datetime.min.time())) + timedelta(hours=12)
+        return Rental.objects.create(user=self.user, book=book, status='ijara', end_date=end_date, **fields)
+
+    def penalty(self, rental):
+        rental.refresh_from_db()
+        return rental.penalty
+
+    def test_charges_every_day_since_due(self):
+        rental = self.rent(self.books[0], self.TODAY - timedelta(days=3))
+        not_due = self.rent(self.books[1], self.TODAY)
+        Rental.accrue_penalties(today=self.TODAY)
+        self.assertEqual(self.penalty(rental), Decimal('30.00'))
+        self.assertEqual(rental.penalty_accrued_on, self.TODAY)
+        self.assertEqual(self.penalty(not_due), 0)
+
+    def test_catches_up_missed_days(self):
+        rental = self.rent(self.books[0], self.TODAY - timedelta(days=10), penalty=Decimal('40.00'),
+                           penalty_accrued_on=self.TODAY - timedelta(days=4))
+        Rental.accrue_penalties(today=self.TODAY)
+        self.assertEqual(self.penalty(rental), Decimal('80.00'))
+
+    def test_idempotent_per_day(self):
+        rental = self.rent(self.books[0], self.TODAY - timedelta(days=2))
+        Rental.accrue_penalties(today=self.TODAY - timedelta(days=1))
+        self.assertEqual(sum(chunk['rows'] for chunk in Rental.accrue_penalties(today=self.TODAY)), 1)
+        self.assertEqual(Rental.accrue_penalties(today=self.TODAY), [])
+        # Charged day by day or all at once, the total is the same.
+        self.assertEqual(self.penalty(rental), Decimal('20.00'))
+
+    def test_chunks(self):
+        rentals = [self.rent(book, self.TODAY - timedelta(days=number + 1)) for number, book in enumerate(self.books)]
+        stats = Rental.accrue_penalties(today=self.TODAY, chunk_size=2)
+        self.assertEqual([chunk['rows'] for chunk in stats], [2, 2, 1])
+        self.assertEqual([self.penalty(rental) for rental in rentals],
+                         [Decimal(10 * (number + 1)) for number in range(5)])
+        self.assertEqual(UserBalance.objects.get(user=self.user).debt, Decimal('150.00'))
+
+
+class UserBalanceTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.books = [cls.create_book(f'Kitob {number}', daily_price=Decimal('1000.00')) for number in range(2)]
+
+    def balance(self, user=None):
+        return tuple(UserBalance.objects.filter(user=user or self.user).values_list('debt', 'active_rentals').get())
+
+    def test_ledger_follows_rental_lifecycle(self):
+        kept, expiring = Rental.reserve(self.user, self.books)[0]
+        self.assertEqual(self.balance(), (0, 2))
+
+        kept.status, kept.end_date = 'ijara', timezone.now() - timedelta(days=2)
+        kept.save()
+        Rental.accrue_penalties()
+        self.assertEqual(self.balance(), (Decimal('20.00'), 2))
+        self.assertEqual(Rental.calculate_user_debt(self.user), Decimal('20.00'))
+
+        Rental.objects.filter(pk=expiring.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        Rental.expire_reservations()
+        self.assertEqual(self.balance(), (Decimal('20.00'), 1))
+
+        kept.refresh_from_db()
+        kept.status = 'qaytarilgan'
+        kept.save()
+        self.assertEqual(self.balance(), (0, 0))
+
+    def run_reconcile(self, **options):
+        out = io.StringIO()
+        call_command('reconcile_balances', chunk_size=1, stdout=out, **options)
+        return out.getvalue()
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        reader, untouched = self.create_readers(2)
+        Rental.reserve(self.user, [self.books[0]])
+        Rental.reserve(untouched, [self.books[0]])
+        UserBalance.objects.filter(user=self.user).update(debt=99, active_rentals=5)
+        # Queryset writes skip Rental.save(), so no ledger row is kept for this reader.
+        Rental.objects.bulk_create([Rental(user=reader, book=self.books[1], status='ijara', penalty=Decimal('7'))])
+
+        output = self.run_reconcile()
+        self.assertIn(f"user={self.user.pk}: ledger=(Decimal('99.00'), 5) expected=", output)
+        self.assertIn(f"user={reader.pk}: ledger=None", output)
+        self.assertNotIn(f"user={untouched.pk}:", output)
+        self.assertIn("Checked 3 users, found 2 drifted balances", output)
+        self.assertEqual(self.balance(), (Decimal('99.00'), 5))
+
+        self.assertIn("fixed 2 drifted balances", self.run_reconcile(fix=True))
+        self.assertEqual(self.balance(), (0, 1))
+        self.assertEqual(self.balance(reader), (Decimal('7.00'), 1))
+        self.assertIn("found 0 drifted balances", self.run_reconcile())
+
+
+class QueryBudgetTests(CatalogTestCase):
+    """Every read endpoint must run a fixed number of queries, whatever the result size."""
+
+    role = 'admin'
+
+    def setUp(self):
+        super().setUp()
+        self.seed(3)
+
+    def seed(self, count):
+        for _ in range(count):
+            author = Author.objects.create(name=f'Author {Author.objects.count()}')
+            genre = Genre.objects.create(name=f'Genre {Genre.objects.count()}')
+            for book_author, book_genre in ((self.author, self.genre), (author, genre)):
+                book = Book.objects.create(
+                    name='Otkan kunlar', description='Tarixiy roman', author=book_author, genre=book_genre,
+                    daily_price=Decimal('5000.00'), available_copies=3,
+                )
+                Basket.objects.create(user=self.user, book=book)
+                Rental.objects.create(user=self.user, book=book, status='ijara')
+                Assessment.objects.create(user=self.user, book=self.first_book, rating='5', comment='Zor')
+
+    @property
+    def first_book(self):
+        return Book.objects.order_by('id').first()
+
+    def assertQueryBudget(self, budget, url, data=None):
+        for extra_rows in (0, 20):
+            self.seed(extra_rows)
+            cache.clear()
+            with self.assertNumQueries(budget):
+                response = self.client.get(url, data)
+            self.assertEqual(response.status_code, 200, response.content)
+
+    def test_books(self):
+        self.assertQueryBudget(1, '/books/')
+
+    def test_book_detail(self):
+        self.assertQueryBudget(1, f'/book/{self.first_book.pk}')
+
+    def test_genres(self):
+        self.assertQueryBudget(1, '/genre/')
+
+    def test_genre_books(self):
+        self.assertQueryBudget(2, f'/genre/{self.genre.pk}')
+
+    def test_authors(self):
+        self.assertQueryBudget(1, '/author/')
+
+    def test_author_books(self):
+        self.assertQueryBudget(2, f'/author/{self.author.pk}')
+
+    def test_basket(self):
+        self.assertQueryBudget(1, '/basket/')
+
+    def test_bron_history(self):
+        # One page query per table: Rental and RentalArchive.
+        self.assertQueryBudget(2, '/bron/')
+
+    def test_rentals(self):
+        self.assertQueryBudget(1, '/rentals/')
+
+    def test_rental_detail(self):
+        rental = Rental.objects.order_by('id').first()
+        self.assertQueryBudget(1, f'/rental/{rental.pk}')
+
+    def test_search(self):
+        self.assertQueryBudget(2, '/search/', {'search': 'otkan'})
+
+    def test_book_reviews(self):
+        self.assertQueryBudget(1, f'/rating/{self.first_book.pk}')
+
+
+class CursorPaginationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(7):
+            cls.create_book(f'Kitob {number}')
+
+    def walk(self, url, key):
+        seen, url = [], f'{url}?page_size=3'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(url).json()
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+            seen += [book['id'] for book in data[key]]
+            url = data['next']
+            if len(seen) == 3:
+                self.create_book('Kitob 99')
+        return seen
+
+    def test_books_pages_are_stable_under_inserts(self):
+        ids = self.walk('/books/', 'results')
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(ids, list(Book.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_genre_books_are_paginated(self):
+        ids = self.walk(f'/genre/{self.genre.pk}', 'books')
+        self.assertEqual(ids, list(Book.objects.order_by('id').values_list('id', flat=True)))
+
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\S+)( AS \S+)?$')
+
+
+def full_scans(queries):
+    """Run EXPLAIN QUERY PLAN for each captured query and return the ones that read a whole table.
+
+    A plain table scan is tolerated only when the query is LIMITed and walks the table in index order
+    (no temporary sort), since it then stops after one page.
+    """
+    scans = []
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+            bounded = ' LIMIT ' in sql and not any('TEMP B-TREE' in detail for detail in details)
+            for detail in details:
+                if FULL_SCAN.match(detail) and not bounded:
+                    scans.append((sql, detail))
+    return scans
+
+
+class QueryPlanTests(CatalogTestCase):
+    """No query behind an endpoint or a periodic task may fall back to a full table scan."""
+
+    role = 'admin'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.books = [cls.create_book(f'Kitob {number}', available_copies=2) for number in range(3)]
+        cls.rental = Rental.objects.create(
+            user=cls.user, book=cls.books[0], status='ijara', end_date=timezone.now() - timedelta(days=2),
+        )
+        Assessment.objects.create(user=cls.user, book=cls.books[0], rating='5')
+
+    def assertNoFullScans(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            action()
+        self.assertTrue(queries.captured_queries)
+        self.assertEqual(full_scans(queries.captured_queries), [])
+
+    def test_read_endpoints(self):
+        urls = [
+            '/books/', f'/book/{self.books[0].pk}', '/books/trending/', '/genre/', f'/genre/{self.genre.pk}',
+            '/author/', f'/author/{self.author.pk}', '/basket/', '/bron/', '/rentals/',
+            f'/rental/{self.rental.pk}', '/search/?search=kitob', f'/rating/{self.books[0].pk}',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNoFullScans(lambda: self.client.get(url))
+
+    def test_basket_and_reservation(self):
+        self.assertNoFullScans(lambda: self.client.post('/basket/', {'book': self.books[1].pk}))
+        self.assertNoFullScans(lambda: self.client.post('/basket/', {'books': [book.pk for book in self.books]},
+                                                         format='json'))
+        self.assertNoFullScans(lambda: self.client.post('/bron/'))
+
+    def test_periodic_tasks(self):
+        self.assertNoFullScans(Rental.accrue_penalties)
+        Rental.objects.filter(pk=self.rental.pk).update(status='bron', created_at=timezone.now() - timedelta(days=2))
+        self.assertNoFullScans(Rental.expire_reservations)
+
+
+@override_settings(PERFORMANCE_METRICS=True)
+class PerformanceMetricsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.book = cls.create_book()
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(metrics, 'registry', metrics.Registry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def timings(response):
+        # {"db": (milliseconds, description), ...} from the Server-Timing header.
+        entries = re.findall(r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?', response['Server-Timing'])
+        return {name: (float(duration), description) for name, duration, description in entries}
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/genre/{self.genre.pk}')
+        timings = self.timings(response)
+        self.assertEqual(list(timings), ['db', 'cache', 'render', 'app', 'total'])
+        self.assertEqual(timings['db'][1], f'{len(queries)} queries')
+        self.assertGreater(len(queries), 0)
+        self.assertGreaterEqual(timings['total'][0], timings['db'][0])
+
+    def test_cache_lookups_are_counted(self):
+        self.assertEqual(self.timings(self.client.get('/search/', {'search': 'otkan'}))['cache'][1], '0 hits, 1 misses')
+        self.assertEqual(self.timings(self.client.get('/search/', {'search': 'otkan'}))['cache'][1], '1 hits, 0 misses')
+
+    def test_metrics_endpoint(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/genre/{self.genre.pk}')
+        self.client.get('/genre/999999')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4')
+        lines = response.content.decode().splitlines()
+        self.assertIn('http_requests_total{view="genre-books",method="GET",status="200"} 1', lines)
+        self.assertIn('http_requests_total{view="genre-books",method="GET",status="404"} 1', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="genre-books",le="+Inf"} 2', lines)
+        self.assertIn('http_request_duration_seconds_count{view="genre-books"} 2', lines)
+        (counted,) = [int(line.split()[-1]) for line in lines if line.startswith('db_queries_total{view="genre-books"}')]
+        self.assertGreaterEqual(counted, len(queries))
+
+    async def test_async_view(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(PerformanceMiddleware(get_response)))
+        token = await Token.objects.acreate(user=self.user)
+        response = await self.async_client.get(f'/async/genre/{self.genre.pk}', AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, 200)
+        # The async views query from sync_to_async threads; those queries are counted too.
+        self.assertNotEqual(self.timings(response)['db'][1], '0 queries')
+
+    @override_settings(PERFORMANCE_METRICS=False)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(f'/genre/{self.genre.pk}'))
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class ConditionalGetTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.book = cls.create_book()
+
+    URLS = ('/book/{book}', '/genre/{genre}', '/author/{author}', '/genre/')
+
+    def urls(self):
+        return [url.format(book=self.book.pk, genre=self.genre.pk, author=self.author.pk) for url in self.URLS]
+
+    def assertNotSharedCacheable(self, response):
+        cache_control = {directive.strip() for directive in response['Cache-Control'].split(',')}
+        self.assertEqual(cache_control, {'private', 'max-age=0', 'must-revalidate'})
+        vary = {header.strip() for header in response['Vary'].split(',')}
+        self.assertTrue({'Authorization', 'Cookie'} <= vary, vary)
+
+    def test_not_modified_without_queries(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotSharedCacheable(response)
+                with self.assertNumQueries(0):
+                    not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified['ETag'], response['ETag'])
+                self.assertEqual(not_modified.content, b'')
+                self.assertNotSharedCacheable(not_modified)
+
+    def test_stale_etag_gets_full_response(self):
+        response = self.client.get(self.urls()[0], HTTP_IF_NONE_MATCH='"BookDetailAPIView-0.0.0"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], self.book.name)
+
+    def test_anonymous_requests_are_rejected(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls()}
+        self.client.force_authenticate(None)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                # A known ETag must not turn into a 304 before the permission check.
+                self.assertIn(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, (401, 403))
+
+    def test_catalog_write_changes_etag(self):
+        etag = self.client.get(f'/book/{self.book.pk}')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.name = 'Abdulla Qodiriy (Julqunboy)'
+            self.author.save()
+        response = self.client.get(f'/book/{self.book.pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['author'], 'Abdulla Qodiriy (Julqunboy)')
+
+    def test_catalog_delete_changes_etag(self):
+        genre = Genre.objects.create(name='Drama')
+        etag = self.client.get('/genre/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Genre.objects.filter(pk=genre.pk).delete()
+        response = self.client.get('/genre/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([item['name'] for item in response.data['results']], ['Roman'])
+
+
+class CatalogExportTests(CatalogTestCase):
+    role = 'admin'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.old = cls.create_book(name='Mehrobdan chayon')
+        cls.new = cls.create_book()
+        Book.objects.filter(pk=cls.old.pk).update(updated_at=timezone.make_aware(datetime(2024, 1, 10)))
+        Book.objects.filter(pk=cls.new.pk).update(updated_at=timezone.make_aware(datetime(2024, 3, 10)))
+
+    def export(self, **params):
+        response = self.client.get('/books/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        lines = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([line['id'] for line in lines], [self.old.pk, self.new.pk])
+        self.assertEqual(lines[1]['author'], 'Abdulla Qodiriy')
+        self.assertEqual(lines[1]['daily_price'], '5000.00')
+
+    def test_csv(self):
+        response = self.client.get('/books/export/', {'type': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="books.csv"')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], list(export.EXPORT_FIELDS))
+        self.assertEqual([row[1] for row in rows[1:]], ['Mehrobdan chayon', 'Otkan kunlar'])
+
+    def test_since(self):
+        for since in ('2024-02-01', '2024-02-01T00:00:00', '2024-02-01T00:00:00+05:00'):
+            with self.subTest(since=since):
+                lines = self.export(since=since).splitlines()
+                self.assertEqual([json.loads(line)['id'] for line in lines], [self.new.pk])
+
+    def test_invalid_parameters(self):
+        for params in ({'type': 'xml'}, {'since': 'kecha'}, {'since': '2024-02-30'},
+                       {'since': '2024-02-30T10:00:00'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/books/export/', params).status_code, 400)
+
+    def test_requires_admin(self):
+        self.user.role = 'user'
+        self.user.save()
+        self.assertEqual(self.client.get('/books/export/').status_code, 403)
+
+
+class TrendingTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.books = [cls.create_book(f'Kitob {number}', available_copies=5) for number in range(3)]
+
+    def setUp(self):
+        super().setUp()
+        # One half-life ago, so a rental recorded now weighs 2.
+        hours = settings.TRENDING_HALF_LIFE_HOURS
+        TrendingState.objects.create(pk=1, epoch=timezone.now() - timedelta(hours=hours))
+
+    def scores(self):
+        return [book.trending_score for book in Book.objects.filter(pk__in=[b.pk for b in self.books]).order_by('id')]
+
+    def test_record_weighs_by_epoch(self):
+        first, second, _ = self.books
+        TrendingState.record([first.pk, second.pk, first.pk])
+        for score, expected in zip(self.scores(), [4, 2, 0]):
+            self.assertAlmostEqual(score, expected, places=3)
+
+    def test_renormalize_keeps_ranking(self):
+        first, second, _ = self.books
+        TrendingState.record([first.pk, first.pk, second.pk])
+        self.assertEqual(TrendingState.renormalize(), 2)
+        for score, expected in zip(self.scores(), [2, 1, 0]):
+            self.assertAlmostEqual(score, expected, places=3)
+        self.assertLess(timezone.now() - TrendingState.current().epoch, timedelta(minutes=1))
+        # New rentals now count from the moved epoch.
+        TrendingState.record([second.pk])
+        self.assertAlmostEqual(self.scores()[1], 2, places=3)
+
+    def test_endpoint_ranks_by_score(self):
+        first, second, third = self.books
+        TrendingState.record([second.pk, second.pk, first.pk])
+        response = self.client.get('/books/trending/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book['id'] for book in response.data], [second.pk, first.pk])
+        for limit, expected in (('1', 1), ('0', 1), ('abc', 2)):
+            with self.subTest(limit=limit):
+                self.assertEqual(len(self.client.get('/books/trending/', {'limit': limit}).data), expected)
+
+    def test_renormalize_is_scheduled(self):
+        tasks = {entry['task'] for entry in settings.CELERY_BEAT_SCHEDULE.values()}
+        self.assertIn('book.tasks.renormalize_trending_scores', tasks)
+
+
+class CatalogImportTests(CatalogTestCase):
+    role = 'admin'
+
+    CSV = ('name,author,genre,daily_price,available_copies\n'
+           'Mehrobdan chayon,Abdulla Qodiriy,Roman,6000,2\n'
+           'Kecha va kunduz,Cholpon,Roman,7000,1\n'
+           'Nomsiz,,Roman,1000,1\n')
+
+    def upload(self, content, name='books.csv', **data):
+        if isinstance(content, str):
+            content = content.encode()
+        return self.client.post('/books/import/', {'file': SimpleUploadedFile(name, content), **data},
+                                format='multipart')
+
+    def test_csv_import(self):
+        response = self.upload(self.CSV)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['rows'], response.data['imported']), (3, 2))
+        self.assertEqual(response.data['errors'], [{'row': 3, 'error': 'Missing fields: author'}])
+        self.assertEqual(Book.objects.get(name='Mehrobdan chayon').author, self.author)
+        self.assertTrue(Author.objects.filter(name='Cholpon').exists())
+
+    def test_bad_jsonl_lines_are_reported_per_row(self):
+        content = '\n'.join([
+            '{"name": "Mehrobdan chayon", "author": "Abdulla Qodiriy", "genre": "Roman", '
+            '"daily_price": 6000, "available_copies": 2}',
+            '{"name": "Kecha va kunduz",',
+            '[1, 2]',
+            '{"name": "Sarob", "author": "Abdulla Qahhor", "genre": "Roman", "daily_price": "5000", '
+            '"available_copies": "1"}',
+        ])
+        response = self.upload(content, name='books.jsonl')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['rows'], response.data['imported'], response.data['skipped']), (4, 2, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+        self.assertTrue(response.data['errors'][0]['error'].startswith('Invalid JSON'))
+        self.assertEqual(response.data['errors'][1]['error'], 'Expected a JSON object')
+
+    def test_non_utf8_rows_are_reported_per_row(self):
+        content = self.CSV.encode().replace(b'Kecha va kunduz', b'Kecha va kunduz \xff')
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['imported'], 1)
+        self.assertIn({'row': 2, 'error': 'Not valid UTF-8'}, response.data['errors'])
+        self.assertFalse(Book.objects.filter(name__startswith='Kecha').exists())
+
+    def test_out_of_range_values_are_reported_per_row(self):
+        content = self.CSV + ('Sarob,Abdulla Qahhor,Roman,5000,-1\n'
+                              'Qutlug qon,Oybek,Roman,1e400,1\n'
+                              'Navoiy,Oybek,Roman,123456789.00,1\n'
+                              'Ulugbek xazinasi,Odil Yoqubov,Roman,NaN,1\n')
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['rows'], response.data['imported']), (7, 2))
+        self.assertEqual(response.data['errors'][1:], [
+            {'row': 4, 'error': 'available_copies must not be negative'},
+            {'row': 5, 'error': 'daily_price or available_copies is not a number'},
+            {'row': 6, 'error': 'daily_price must be below 100000000'},
+            {'row': 7, 'error': 'daily_price must be below 100000000'},
+        ])
+        self.assertEqual(set(Book.objects.values_list('name', flat=True)), {'Mehrobdan chayon', 'Kecha va kunduz'})
+
+    def test_skip_resumes_import(self):
+        response = self.upload(self.CSV, skip='1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['rows'], response.data['imported']), (2, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+        self.assertFalse(Book.objects.filter(name='Mehrobdan chayon').exists())
+
+    def test_invalid_skip(self):
+        for skip in ('abc', '-1', '1.5'):
+            with self.subTest(skip=skip):
+                self.assertEqual(self.upload(self.CSV, skip=skip).status_code, 400)
+        self.assertFalse(Book.objects.exists())
+
+    def test_failed_chunk_reports_resume_point(self):
+        importer = CatalogImporter(chunk_size=1)
+        original = importer.import_chunk
+
+        def import_chunk(chunk, first_row):
+            if first_row == 2:
+                raise RuntimeError('database is gone')
+            return original(chunk, first_row)
+
+        importer.import_chunk = import_chunk
+        rows = read_rows(io.StringIO(self.CSV), 'csv')
+        with self.assertRaises(CatalogImportError) as raised, self.assertLogs('book.importer', 'ERROR'):
+            importer.run(rows)
+        self.assertEqual(raised.exception.resume_from, 1)
+        self.assertEqual(list(Book.objects.values_list('name', flat=True)), ['Mehrobdan chayon'])
+
+    def test_requires_admin(self):
+        self.user.role = 'user'
+        self.user.save()
+        self.assertEqual(self.upload(self.CSV).status_code, 403)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    DATABASE_REPLICAS=['replica1'],
+    READ_YOUR_WRITES_SECONDS=5,
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Routing decisions only; the replica alias is never connected to here."""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+        self.middleware = ReplicaRoutingMiddleware(self.route)
+
+    def route(self, request):
+        return HttpResponse(self.router.db_for_read(Book))
+
+    def read_db(self, method='get', token='Token abc'):
+        headers = {'HTTP_AUTHORIZATION': token} if token else {}
+        request = getattr(self.factory, method)('/books/', **headers)
+        return self.middleware(request).content.decode()
+
+    def test_outside_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Book), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_write(Book), DEFAULT_DB_ALIAS)
+
+    def test_safe_requests_use_replica(self):
+        self.assertEqual(self.read_db(), 'replica1')
+        self.assertEqual(self.read_db(token=None), 'replica1')
+
+    def test_writes_read_from_primary(self):
+        self.assertEqual(self.read_db('post'), DEFAULT_DB_ALIAS)
+
+    def test_reads_are_pinned_after_write(self):
+        self.read_db('post')
+        self.assertEqual(self.read_db(), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.read_db(token='Token other'), 'replica1')
+        with mock.patch('time.time', return_value=time.time() + 10):
+            self.assertEqual(self.read_db(), 'replica1')
+
+    def test_login_cookie_is_pinned(self):
+        def login(request):
+            response = HttpResponse()
+            response.set_cookie(settings.SESSION_COOKIE_NAME, 'new-session')
+            return response
+
+        ReplicaRoutingMiddleware(login)(self.factory.post('/api-auth/login/'))
+        self.factory.cookies[settings.SESSION_COOKIE_NAME] = 'new-session'
+        self.assertEqual(self.read_db(token=None), DEFAULT_DB_ALIAS)
+
+    async def test_async_requests(self):
+        async def route(request):
+            return self.route(request)
+
+        middleware = ReplicaRoutingMiddleware(route)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = self.factory.get('/books/', HTTP_AUTHORIZATION='Token abc')
+        self.assertEqual((await middleware(request)).content, b'replica1')
+        await middleware(self.factory.post('/books/', HTTP_AUTHORIZATION='Token abc'))
+        self.assertEqual((await middleware(request)).content.decode(), DEFAULT_DB_ALIAS)
+
+    def test_transactions_use_primary(self):
+        token = routers.allow_replica_reads(True)
+        try:
+            with mock.patch('book.routers.connections') as connections:
+                connections[DEFAULT_DB_ALIAS].in_atomic_block = True
+                self.assertEqual(self.router.db_for_read(Book), DEFAULT_DB_ALIAS)
+        finally:
+            routers.reset_replica_reads(token)
+
+
+LAGGING_REPLICA = 'lagging_replica'
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DATABASE_REPLICAS=[LAGGING_REPLICA])
+class ReplicaLagTests(CatalogFixtureMixin, APITransactionTestCase):
+    """lagging_replica is a separate database that is never written to, i.e. a replica that lags forever.
+
+    Not a TestCase: reads inside its per-test transaction would always stay on the primary.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # The alias is not in settings.DATABASES and exists only while this class runs: it is registered with
+        # the connection handler and given its (in-memory) tables here, and only then added to `databases`,
+        # which the test runner would otherwise try to set up before any test starts.
+        connections.settings[LAGGING_REPLICA] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+            LAGGING_REPLICA: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+        })[LAGGING_REPLICA]
+        cls.addClassCleanup(cls.remove_lagging_replica)
+        connections[LAGGING_REPLICA].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        cls.databases = {DEFAULT_DB_ALIAS, LAGGING_REPLICA}
+        super().setUpClass()
+
+    @staticmethod
+    def remove_lagging_replica():
+        connections[LAGGING_REPLICA].close()
+        del connections[LAGGING_REPLICA]
+        del connections.settings[LAGGING_REPLICA]
+
+    def setUp(self):
+        cache.clear()
+        self.create_catalog()
+        self.book = self.create_book()
+        # The lagging replica has no users either; the header only identifies the client for pinning.
+        self.client.force_authenticate(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token lag-test')
+
+    def test_read_your_writes(self):
+        self.assertEqual(self.client.get(f'/book/{self.book.pk}').status_code, 404)
+
+        response = self.client.post('/basket/', {'book': self.book.pk})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.client.get(f'/book/{self.book.pk}').status_code, 200)
+
+        with mock.patch('time.time', return_value=time.time() + settings.READ_YOUR_WRITES_SECONDS + 1):
+            self.assertEqual(self.client.get(f'/book/{self.book.pk}').status_code, 404)
+
+
+class CachedAuthenticationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        # Authentication itself is under test: no force_authenticate here.
+        cache.clear()
+        local_cache.clear()
+
+    def authenticate(self, key=None):
+        return CachedTokenAuthentication().authenticate_credentials(key or self.token.key)[0]
+
+    def assertCachedRequestIsFree(self):
+        url = f'/genre/{self.genre.pk}'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_token_without_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertCachedRequestIsFree()
+        local_cache.clear()
+        self.assertCachedRequestIsFree()
+
+    def test_session_without_queries(self):
+        self.client.login(email='reader@example.com', password='secret')
+        self.assertCachedRequestIsFree()
+
+    def test_role_change_invalidates(self):
+        self.assertEqual(self.authenticate().role, 'user')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.role = 'admin'
+            self.user.save()
+        self.assertEqual(self.authenticate().role, 'admin')
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_password_hash_is_not_cached(self):
+        self.authenticate()
+        self.client.login(email='reader@example.com', password='secret')
+        self.client.get(f'/genre/{self.genre.pk}')
+        cached = cache.get(user_key(self.user.pk))
+        self.assertNotIn('password', cached)
+        self.assertNotIn(self.user.password, repr(cached))
+        self.assertEqual(self.authenticate().email, self.user.email)
+
+    def test_cached_user_save_keeps_password(self):
+        self.authenticate()
+        user = self.authenticate()
+        user.role = 'admin'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.role, 'admin')
+        self.assertTrue(self.user.check_password('secret'))
+
+    def test_password_change_ends_session(self):
+        self.client.login(email='reader@example.com', password='secret')
+        self.assertEqual(self.client.get(f'/genre/{self.genre.pk}').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(password=make_password('new secret'))
+        self.assertIn(self.client.get(f'/genre/{self.genre.pk}').status_code, (401, 403))
+
+    def test_bulk_deactivation_is_rejected(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_revoked_token_is_rejected(self):
+        key = self.token.key
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(key)
+
+
+class FastPathRenderingTests(CatalogTestCase):
+    """The fast-path list endpoints must return exactly the bytes the ModelSerializers + JSONRenderer did."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.author.name = "O\u2018tkir Hoshimov"
+        cls.author.save()
+        for index, price in enumerate(('5000.00', '0.50', '12345678.9')):
+            book = cls.create_book(
+                f'Dunyoning ishlari {index}', description='Qator\u2028ajratgich \u2029 "qo\'shtirnoq" \u00e9',
+                daily_price=Decimal(price), available_copies=index, is_available=bool(index),
+            )
+            Rental.objects.create(user=cls.user, book=book, status='ijara', penalty=Decimal('1.5'),
+                                  start_date=timezone.now(), end_date=timezone.now() + timedelta(days=index))
+        Rental.objects.create(user=cls.user, book=cls.create_book('Dunyoning ishlari 3'))
+
+    def assertSameBytes(self, response, expected):
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_books(self):
+        response = self.client.get('/books/', {'page_size': 2})
+        books = Book.objects.select_related('author', 'genre').order_by('id')[:2]
+        self.assertSameBytes(response, {'next': response.data['next'], 'previous': None,
+                                        'results': BookSerializer(books, many=True).data})
+
+    def test_search(self):
+        response = self.client.get('/search/', {'search': 'dunyoning'})
+        books = Book.objects.select_related('author', 'genre').order_by('id')
+        self.assertSameBytes(response, BookSerializer(books, many=True).data)
+
+    def test_rentals(self):
+        response = self.client.get('/bron/')
+        rentals = Rental.objects.filter(user=self.user).select_related('book').order_by('-id')
+        self.assertSameBytes(response, {'books': RentalSerializer(rentals, many=True).data, 'next': None,
+                                        'previous': None})
+
+    def test_renderer(self):
+        data = {'at': timezone.now(), 'price': Decimal('1.10'), 'text': 'a\u2028b\u2029c \u0431', 1: [None, True]}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render({'big': 2 ** 70}), JSONRenderer().render({'big': 2 ** 70}))
+
+
+class SearchIndexTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # "sarob" in the name, the author and the genre respectively.
+        cls.by_name = cls.create_book('Sarob')
+        cls.by_author = Book.objects.create(name='Anor', author=Author.objects.create(name='Sarob Qahhor'),
+                                            genre=cls.genre, daily_price=Decimal('5000.00'), available_copies=1)
+        cls.by_genre = Book.objects.create(name='Dahshat', author=cls.author, genre=Genre.objects.create(name='Sarob'),
+                                           daily_price=Decimal('5000.00'), available_copies=1)
+
+    def test_bm25_weights_name_over_author_over_genre(self):
+        self.assertEqual(search.search_book_ids('sarob'), [self.by_name.pk, self.by_author.pk, self.by_genre.pk])
+        self.assertEqual(search.search_book_ids('sarob', limit=1), [self.by_name.pk])
+
+    def test_terms_are_prefixes_and_all_required(self):
+        book = self.create_book('Otkan kunlar')
+        self.assertEqual(search.search_book_ids('otk kun'), [book.pk])
+        self.assertEqual(search.search_book_ids('otk sarob'), [])
+        self.assertEqual(search.search_book_ids('   '), [])
+
+    def test_index_follows_writes(self):
+        self.by_author.author.name = 'Abdulla Qahhor'
+        self.by_author.author.save()
+        self.assertNotIn(self.by_author.pk, search.search_book_ids('sarob'))
+        self.by_name.delete()
+        self.assertEqual(search.search_book_ids('sarob'), [self.by_genre.pk])
+        # Books deleted along with their genre leave the index too.
+        self.by_genre.genre.delete()
+        self.assertEqual(search.search_book_ids('sarob'), [])
+
+    def test_rebuild_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        self.assertEqual(search.search_book_ids('sarob'), [])
+
+        chunks = list(search.rebuild_index(chunk_size=2))
+        self.assertEqual([start for start, _ in chunks], [self.by_name.pk, self.by_name.pk + 2])
+        self.assertEqual(sum(rows for _, rows in chunks), 3)
+        self.assertEqual(search.search_book_ids('sarob'), [self.by_name.pk, self.by_author.pk, self.by_genre.pk])
+
+
+class SearchCacheTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.book = cls.create_book(available_copies=2)
+
+    def search(self, query='otkan'):
+        response = self.client.get('/search/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_repeat_search_is_served_from_cache(self):
+        self.assertEqual([book['id'] for book in self.search()], [self.book.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual([book['id'] for book in self.search()], [self.book.pk])
+        self.assertEqual(get_counters('book_search', ('hit', 'miss', 'recompute')),
+                         {'hit': 1, 'miss': 1, 'recompute': 1})
+
+    def test_empty_results_are_cached(self):
+        self.assertEqual(self.search('yoq'), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('yoq'), [])
+
+    def test_stock_change_bumps_the_key(self):
+        self.assertEqual(self.search()[0]['available_copies'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Rental.reserve(self.user, [self.book])
+        self.assertEqual(self.search()[0]['available_copies'], 1)
+
+    def test_author_rename_bumps_the_key(self):
+        self.search()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.name = "Abdulla Qodiriy (Julqunboy)"
+            self.author.save()
+        self.assertEqual(self.search()[0]['author'], "Abdulla Qodiriy (Julqunboy)")
+
+    def test_waiting_worker_gets_the_lock_holders_result(self):
+        cache.add('key_lock', 1)
+        compute = mock.Mock(return_value=['own'])
+        with mock.patch('book.cache.time.sleep', side_effect=lambda seconds: cache.set('key', ['shared'])):
+            self.assertEqual(get_or_compute('key', compute, 60, 10, 'test'), ['shared'])
+        compute.assert_not_called()
+
+    @override_settings(CACHE_LOCK_WAIT=0.1)
+    def test_slow_lock_holder_is_not_waited_for(self):
+        cache.add('key_lock', 1)
+        self.assertEqual(get_or_compute('key', lambda: ['own'], 60, 10, 'test'), ['own'])
+        # Computed without the lock, so not stored: the lock holder's result will be.
+        self.assertIsNone(cache.get('key'))
+
+
+class NormalizationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='reader@example.com', password='secret')
+        cls.author = Author.objects.create(name='Михаил Булгаков')
+        cls.genre = Genre.objects.create(name='Роман')
+        cls.book = cls.create_book('Мастер и Маргарита')
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name("O\u2018tkan  kunlar!"), 'otkan kunlar')
+        self.assertEqual(normalize_name('Ўткан кунлар'), 'otkan kunlar')
+        self.assertEqual(normalize_name('Қўшиқ ва ҳаёт'), 'qoshiq va hayot')
+        self.assertEqual(normalize_name('  '), '')
+
+    def test_cyrillic_titles_are_searchable(self):
+        self.assertEqual(self.book.cleaned_name, 'master i margarita')
+        for query in ('Маргарита', 'margarita', 'булгаков'):
+            with self.subTest(query=query):
+                response = self.client.get('/search/', {'search': query})
+                self.assertEqual([book['id'] for book in response.data], [self.book.pk])
+
+    def test_backfill(self):
+        Book.objects.update(cleaned_name='')
+        Author.objects.update(cleaned_name='')
+        call_command('backfill_cleaned_names', chunk_size=1, stdout=io.StringIO())
+        self.assertEqual(Book.objects.get().cleaned_name, 'master i margarita')
+        self.assertEqual(Author.objects.get().cleaned_name, 'mikhail bulgakov')
+        response = self.client.get('/search/', {'search': 'bulgakov'})
+        self.assertEqual([book['id'] for book in response.data], [self.book.pk])
+
+
+class ReservationExpiryTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.book = cls.create_book(available_copies=5)
+
+    def test_reserve_sets_deadline(self):
+        (rental,), _ = Rental.reserve(self.user, [self.book])
+        self.assertAlmostEqual(rental.expires_at, timezone.now() + Rental.BRON_TTL, delta=timedelta(minutes=1))
+
+    def test_only_due_reservations_expire(self):
+        now = timezone.now()
+        readers = self.create_readers(3)
+        due = Rental.objects.create(user=readers[0], book=self.book, expires_at=now - timedelta(minutes=5))
+        pending = Rental.objects.create(user=readers[1], book=self.book, expires_at=now + timedelta(hours=1))
+        legacy = Rental.objects.create(user=readers[2], book=self.book, expires_at=now)
+        Rental.objects.filter(pk=legacy.pk).update(expires_at=None, created_at=now - timedelta(days=2))
+
+        result = Rental.expire_reservations()
+
+        self.assertEqual(result['rentals'], 2)
+        statuses = dict(Rental.objects.values_list('pk', 'status'))
+        self.assertEqual((statuses[due.pk], statuses[pending.pk], statuses[legacy.pk]), ('bekor', 'bron', 'bekor'))
+        self.assertEqual(Book.objects.get().available_copies, 7)
+        # The legacy row was due at created_at + BRON_TTL, a day before the other one.
+        self.assertGreaterEqual(result['max_lag'], timedelta(days=1).total_seconds())
+
+    def test_expiry_in_chunks_restores_each_book_once(self):
+        other = self.create_book('Mehrobdan chayon', available_copies=0)
+        past = timezone.now() - timedelta(minutes=5)
+        for reader in self.create_readers(3):
+            Rental.objects.create(user=reader, book=self.book, expires_at=past)
+            Rental.objects.create(user=reader, book=other, expires_at=past)
+
+        # Both books get 3 copies back: one shared UPDATE, after all chunks are flipped.
+        with CaptureQueriesContext(connection) as queries:
+            result = Rental.expire_reservations(chunk_size=2)
+        increments = [query['sql'] for query in queries if '"available_copies" = (' in query['sql']]
+        self.assertEqual(len(increments), 1)
+        self.assertEqual(result['rentals'], 6)
+        self.assertEqual(set(Rental.objects.values_list('status', flat=True)), {'bekor'})
+        self.assertEqual(dict(Book.objects.values_list('pk', 'available_copies')), {self.book.pk: 8, other.pk: 3})
+
+    def test_cancel_bron_increments_stock(self):
+        rental = Rental.objects.create(user=self.user, book=self.book, expires_at=timezone.now() + timedelta(hours=1))
+        rental.cancel_bron()
+        self.assertEqual(Rental.objects.get(pk=rental.pk).status, 'bron')
+
+        rental.expires_at = timezone.now() - timedelta(minutes=1)
+        # A concurrent reservation took a copy after this rental's book was loaded.
+        Book.objects.filter(pk=self.book.pk).update(available_copies=F('available_copies') - 1)
+        rental.cancel_bron()
+        self.assertEqual(Rental.objects.get(pk=rental.pk).status, 'bekor')
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 5)
+
+    def test_add_copies_groups_equal_amounts(self):
+        books = [self.create_book(f'Kitob {number}', available_copies=0) for number in range(3)]
+        with self.assertNumQueries(2):
+            Book.add_copies({books[0].pk: 1, books[1].pk: 1, books[2].pk: 4})
+        self.assertEqual([book.available_copies for book in Book.objects.filter(pk__in=[b.pk for b in books])
+                          .order_by('id')], [1, 1, 4])
+
+    def test_expiry_lag_is_exported(self):
+        Rental.objects.create(user=self.user, book=self.book, expires_at=timezone.now() - timedelta(seconds=30))
+        Rental.expire_reservations()
+        lines = metrics.expiry_lines()
+        lag = next(line for line in lines if line.startswith('reservation_expiry_lag_seconds '))
+        self.assertGreaterEqual(float(lag.split()[1]), 30)
+        self.assertIn('reservations_expired_total 1', lines)
+
+
+class DuplicateReservationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.book = cls.create_book(available_copies=5)
+
+    def test_one_active_rental_per_book(self):
+        rental = Rental.objects.create(user=self.user, book=self.book)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Rental.objects.create(user=self.user, book=self.book, status='ijara')
+        Rental.objects.filter(pk=rental.pk).update(status='bekor')
+        Rental.objects.create(user=self.user, book=self.book)
+
+    def test_reserving_a_rented_book_is_reported(self):
+        Rental.reserve(self.user, [self.book])
+        reserved, errors = Rental.reserve(self.user, [self.book])
+        self.assertEqual(reserved, [])
+        self.assertEqual(errors[0]['book'], self.book.pk)
+
+    def test_concurrent_duplicate_returns_400(self):
+        Rental.objects.create(user=self.user, book=self.book)
+        Basket.objects.create(user=self.user, book=self.book)
+        # As if a parallel request committed its bron after this one checked for active rentals.
+        with mock.patch.object(Rental, 'ACTIVE_STATUSES', ('ijara',)):
+            response = self.client.post('/bron/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Rental.objects.count(), 1)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 5)
+        self.assertTrue(Basket.objects.filter(user=self.user, book=self.book).exists())
+
+
+class SeedDataTests(CatalogTestCase):
+    def test_at_most_one_active_rental_per_book(self):
+        # Few users and books, so the skewed draws repeat (user, book) pairs many times.
+        call_command('seed_data', authors=3, genres=2, books=20, users=5, rentals=300, assessments=10,
+                     stdout=io.StringIO())
+        self.assertEqual(Rental.objects.count(), 300)
+        active = Rental.objects.filter(status__in=Rental.ACTIVE_STATUSES)
+        self.assertEqual(active.count(), active.values('user', 'book').distinct().count())
+        self.assertGreater(active.count(), 0)
+
+
+class BenchmarkEndpointsTests(CatalogTestCase):
+    role = 'admin'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # The reserve step takes the next three available books each iteration.
+        for number in range(9):
+            cls.create_book(f'Kitob {number}', available_copies=2)
+
+    def setUp(self):
+        super().setUp()
+        # The command logs in through the session backend; earlier tests may have cached a user under this id.
+        local_cache.clear()
+
+    def test_smoke(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/bench.json'
+            with warnings.catch_warnings():
+                # Multi-word search terms put spaces into locmem cache keys; Redis does not mind.
+                warnings.simplefilter('ignore', CacheKeyWarning)
+                call_command('benchmark_endpoints', iterations=2, warmup=1, output=output, stdout=io.StringIO())
+            with open(output) as file:
+                report = json.load(file)
+        self.assertEqual(report['endpoints']['bron_create']['status'], 201)
+        self.assertTrue(all(result['status'] == 200 for name, result in report['endpoints'].items()
+                            if name != 'bron_create'))
+        # Every reservation was rolled back.
+        self.assertFalse(Rental.objects.exists())
+
+
+class InventoryFlushTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.book = cls.create_book(available_copies=5, hot_inventory=True)
+
+    def test_flush_applies_deltas_once(self):
+        for delta in (-1, -1, 1, -2):
+            InventoryDelta.objects.create(book=self.book, delta=delta, token=uuid.uuid4())
+        self.assertEqual(InventoryDelta.flush(batch_size=3), 4)
+        self.assertEqual(InventoryDelta.flush(), 0)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+
+class RentalArchiveTests(CatalogTestCase):
+    def rental(self, status, closed_days_ago=0):
+        # A book per rental: a reader has at most one active rental of a book.
+        rental = Rental.objects.create(user=self.user, book=self.create_book(), status=status)
+        Rental.objects.filter(pk=rental.pk).update(updated_at=timezone.now() - timedelta(days=closed_days_ago))
+        return rental
+
+    def test_archives_only_old_closed_rentals(self):
+        old_returned = self.rental('qaytarilgan', 200)
+        old_cancelled = self.rental('bekor', 200)
+        recent = self.rental('qaytarilgan', 1)
+        active = self.rental('ijara', 200)
+
+        stats = list(Rental.archive_closed(older_than=timedelta(days=90), chunk_size=2))
+
+        self.assertEqual(sum(chunk['rows'] for chunk in stats), 2)
+        self.assertEqual(set(RentalArchive.objects.values_list('id', flat=True)), {old_returned.pk, old_cancelled.pk})
+        self.assertEqual(set(Rental.objects.values_list('id', flat=True)), {recent.pk, active.pk})
+        self.assertEqual(RentalArchive.objects.get(pk=old_returned.pk).status, 'qaytarilgan')
+        # Rerunning finds nothing left to move.
+        self.assertEqual(sum(chunk['rows'] for chunk in Rental.archive_closed(older_than=timedelta(days=90))), 0)
+
+    def test_history_reads_both_tables(self):
+        rentals = [self.rental('qaytarilgan', 200 - i) if i % 2 else self.rental('ijara') for i in range(7)]
+        call_command('archive_rentals', days=90, stdout=io.StringIO())
+        self.assertEqual(RentalArchive.objects.count(), 3)
+
+        seen, url = [], '/bron/?page_size=3'
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['status'] for row in response.json()['books'])
+            url = response.json()['next']
+        self.assertEqual(seen, [rental.status for rental in reversed(rentals)])
+
+        previous = self.client.get(self.client.get('/bron/?page_size=3').json()['next']).json()['previous']
+        statuses = [row['status'] for row in self.client.get(previous).json()['books']]
+        self.assertEqual(statuses, [rental.status for rental in reversed(rentals)][:3])
+
+
+@unittest.skipUnless(fakeredis or inventory.is_available(), 'needs fakeredis or a reachable HOT_INVENTORY_REDIS_URL')
+class HotInventoryTests(CatalogTestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not inventory.is_available():
+            # fakeredis runs the Lua scripts through lupa.
+            patcher = mock.patch.multiple(inventory, _client=fakeredis.FakeRedis(), _scripts={})
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.book = cls.create_book(available_copies=2, hot_inventory=True)
+        cls.users = cls.create_readers(3)
+
+    def setUp(self):
+        super().setUp()
+        inventory.forget([self.book.pk])
+        self.addCleanup(inventory.forget, [self.book.pk])
+        self.assertEqual(InventoryDelta.reconcile(), {self.book.pk: 2})
+
+    def reserve(self, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            reserved, _ = Rental.reserve(user, [Book.objects.get(pk=self.book.pk)])
+        return reserved
+
+    def test_reservations_do_not_touch_the_book_row(self):
+        self.assertEqual([len(self.reserve(user)) for user in self.users], [1, 1, 0])
+        self.assertEqual(inventory.stock(self.book.pk), 0)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 2)
+
+        InventoryDelta.flush()
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 0)
+        self.assertEqual(InventoryDelta.reconcile(), {self.book.pk: 0})
+
+    def test_expired_reservation_returns_copy(self):
+        (rental,) = self.reserve(self.users[0])
+        Rental.objects.filter(pk=rental.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            Rental.expire_reservations()
+        self.assertEqual(inventory.stock(self.book.pk), 2)
+        self.assertEqual(InventoryDelta.reconcile(), {self.book.pk: 2})
+
+    def test_reconcile_returns_abandoned_claims(self):
+        # A claim whose transaction never committed, e.g. the process crashed mid-request.
+        (token,) = InventoryDelta.claim([self.book]).values()
+        self.assertEqual(inventory.stock(self.book.pk), 1)
+        self.assertEqual(InventoryDelta.reconcile(), {self.book.pk: 1})
+
+        inventory.client().zadd(inventory.keys(self.book.pk)[1], {token: time.time() - InventoryDelta.TOKEN_TIMEOUT - 1})
+        self.assertEqual(InventoryDelta.reconcile(), {self.book.pk: 2})
+
+    def test_outer_rollback_releases_claims(self):
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+            with Rental.reserving():
+                self.assertEqual(len(Rental.reserve(self.users[0], [self.book])[0]), 1)
+                raise RuntimeError('later step of the request failed')
+        self.assertEqual(inventory.stock(self.book.pk), 2)
+        self.assertEqual(inventory.pending(self.book.pk), ({}, {}))
+
+    def test_bron_request_rollback_releases_claims(self):
+        Basket.objects.create(user=self.users[0], book=self.book)
+        self.client.force_authenticate(self.users[0])
+        with mock.patch.object(TrendingState, 'record', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.client.post('/bron/')
+        self.assertEqual(inventory.stock(self.book.pk), 2)
+        self.assertFalse(Rental.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/bron/').status_code, 201)
+        self.assertEqual(inventory.stock(self.book.pk), 1)
+        self.assertEqual(inventory.pending(self.book.pk), ({}, {}))
+
+    def test_lost_counters_are_reloaded(self):
+        self.reserve(self.users[0])
+        inventory.forget([self.book.pk])
+        self.assertEqual(len(self.reserve(self.users[1])), 1)
+        self.assertEqual(inventory.stock(self.book.pk), 0)
+
+
+class BasketBatchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.books = [cls.create_book(f'Kitob {number}') for number in range(16)]
+
+    def add(self, book_ids):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/basket/', {'books': book_ids}, format='json')
+        return response, len(queries)
+
+    def test_constant_queries(self):
+        _, single = self.add([self.books[0].pk])
+        response, batch = self.add([book.pk for book in self.books[1:]])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(batch, single)
+        self.assertEqual(Basket.objects.filter(user=self.user).count(), 16)
+
+    def test_per_item_status(self):
+        self.client.post('/basket/', {'book': self.books[0].pk})
+        response, _ = self.add([self.books[0].pk, self.books[1].pk, 999999, self.books[1].pk])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([(item['book'], item['status']) for item in response.data['results']], [
+            (self.books[0].pk, 'exists'), (self.books[1].pk, 'added'), (999999, 'not_found'),
+        ])
+        response, _ = self.add([self.books[0].pk])
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_payload(self):
+        self.assertEqual(self.add([])[0].status_code, 400)
+        self.assertEqual(self.add(['kitob'])[0].status_code, 400)
+
+
+class RecommendationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.books = [cls.create_book(f'Kitob {number}', available_copies=5) for number in range(4)]
+        cls.readers = cls.create_readers(3)
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path_override = override_settings(RECOMMENDATIONS_MATRIX_PATH=f'{directory.name}/corental.npz')
+        path_override.enable()
+        self.addCleanup(path_override.disable)
+        a, b, c, d = self.books
+        self.rent({0: [a, b], 1: [a, b, c], 2: [c, d]})
+
+    def rent(self, history):
+        for reader, books in history.items():
+            for book in books:
+                Rental.objects.create(user=self.readers[reader], book=book, status='qaytarilgan')
+
+    def neighbors(self):
+        return dict(BookRecommendation.objects.values_list('book_id', 'neighbors'))
+
+    def test_ranked_by_cosine_similarity(self):
+        BookRecommendation.rebuild()
+        a, b, c, d = [book.pk for book in self.books]
+        # a and b share both of their readers; a and c only one of two each.
+        self.assertEqual(self.neighbors()[a], [b, c])
+        self.assertEqual(self.neighbors()[d], [c])
+
+    def test_incremental_update_matches_full_rebuild(self):
+        BookRecommendation.rebuild()
+        a, b, c, d = self.books
+        self.rent({2: [a], 0: [d]})
+        # Archived rentals stay part of the history.
+        call_command('archive_rentals', days=0, stdout=io.StringIO())
+
+        stats = BookRecommendation.rebuild()
+        self.assertEqual(stats['readers'], 2)
+        incremental, incremental_neighbors = recommendations.load()[0], self.neighbors()
+
+        BookRecommendation.rebuild(full=True)
+        self.assertEqual((incremental != recommendations.load()[0]).nnz, 0)
+        self.assertEqual(incremental_neighbors, self.neighbors())
+
+    def test_neighbor_gaining_readers_reranks(self):
+        x, y, z = [self.create_book(f'Yangi {number}') for number in range(3)]
+        readers = [User.objects.create_user(email=f'new{number}@example.com', password='secret')
+                   for number in range(6)]
+        for reader, books in zip(readers, [(x, y), (x, z), (x, z)]):
+            for book in books:
+                Rental.objects.create(user=reader, book=book, status='qaytarilgan')
+        BookRecommendation.rebuild()
+        self.assertEqual(self.neighbors()[x.pk], [z.pk, y.pk])
+
+        # z alone gains readers: x's row of C is unchanged, but cos(x, z) drops below cos(x, y).
+        for reader in readers[3:]:
+            Rental.objects.create(user=reader, book=z, status='qaytarilgan')
+        BookRecommendation.rebuild()
+        self.assertEqual(self.neighbors()[x.pk], [y.pk, z.pk])
+        incremental = self.neighbors()
+        BookRecommendation.rebuild(full=True)
+        self.assertEqual(incremental, self.neighbors())
+
+    def test_endpoint(self):
+        BookRecommendation.rebuild()
+        a, b, c, d = self.books
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/book/{a.pk}/recommendations')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.json()], [b.name, c.name])
+        self.assertEqual(self.client.get('/book/999999/recommendations').status_code, 404)
+
+
+class AsyncViewTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.book = cls.create_book()
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        super().setUp()
+        # The async views authenticate the raw request themselves.
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def walk(self, url, key='results', **params):
+        ids, data = [], {'next': f'{url}?' + '&'.join(f'{name}={value}' for name, value in params.items())}
+        while data['next']:
+            response = self.client.get(data['next'])
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            ids += [item['id'] for item in data[key]]
+        return ids
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        for url in ('/async/books/', f'/async/book/{self.book.pk}', '/async/genre/', '/async/search/?search=kitob'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION='Token wrong')
+        self.assertEqual(self.client.get('/async/books/').status_code, 401)
+
+    def test_session_authentication(self):
+        self.client.credentials()
+        self.client.login(email='reader@example.com', password='secret')
+        self.assertEqual(self.client.get('/async/books/').status_code, 200)
+
+    def test_keyset_pages(self):
+        books = [self.book] + [self.create_book(f'Kitob {number}') for number in range(4)]
+        self.assertEqual(self.walk('/async/books/', page_size=2), [book.pk for book in books])
+        self.assertEqual(self.walk(f'/async/genre/{self.genre.pk}', 'books', page_size=3),
+                         [book.pk for book in books])
+        self.assertEqual(self.walk(f'/async/author/{self.author.pk}', 'books'), [book.pk for book in books])
+        genres = self.client.get('/async/genre/').json()
+        self.assertEqual(([genre['name'] for genre in genres['results']], genres['next']), (['Roman'], None))
+
+    def test_page_size_is_clamped(self):
+        self.create_book('Kitob 1')
+        for page_size, count in (('0', 1), ('-1', 1), ('abc', 2), ('1000', 2)):
+            with self.subTest(page_size=page_size):
+                response = self.client.get('/async/books/', {'page_size': page_size})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), count)
+
+    def test_detail_matches_sync_view(self):
+        response = self.client.get(f'/async/book/{self.book.pk}')
+        self.assertEqual(response.json(), BookSerializer(self.book).data)
+        self.assertEqual(self.client.get('/async/book/999999').status_code, 404)
+        self.assertEqual(self.client.get('/async/genre/999999').status_code, 404)
+
+    def test_search_requires_query(self):
+        self.assertEqual(self.client.get('/async/search/').status_code, 400)
+
+    @override_settings(BOOK_SEARCH_FTS=False)
+    def test_search_fallback_matches_sync_view(self):
+        # Both paths share cache keys: whichever runs first decides what the other one returns.
+        for first, second in (('/async/search/', '/search/'), ('/search/', '/async/search/')):
+            with self.subTest(first=first):
+                cache.clear()
+                by_author = self.client.get(first, {'search': 'qodiriy'}).json()
+                self.assertEqual([book['id'] for book in by_author], [self.book.pk])
+                self.assertEqual(self.client.get(second, {'search': 'qodiriy'}).json(), by_author)
+                self.assertEqual(self.client.get(second, {'search': 'roman'}).json(),
+                                 self.client.get(first, {'search': 'roman'}).json())
 
-# Create your tests here.
@@ -1,17 +1,24 @@
 from django.urls import path
 
+from book import async_views
+
 # from book.views import BookCreateListAPIView, BookDetailAPIView, GenreCreateListAPIView, GenreBooksListAPIView, \
 #     AuthorCreateListAPIVew, AuthorBooksListAPIView, BasketCreateListAPIView, RentalCreateListAPIView, \
 #     RentalUpdateAPIView, SearchAPIView
 
 from book.views import BookCreateListAPIView, BookDetailAPIView, GenreCreateListAPIView, GenreBooksListAPIView, \
     AuthorCreateListAPIVew, AuthorBooksListAPIView, BasketCreateListAPIView, RentalCreateListAPIView, \
-    RentalUpdateAPIView, SearchAPIView, RentalListAPIView, RentalDetailAPIView, BookReviewsList, BookAssessmentAPIView
+    RentalUpdateAPIView, SearchAPIView, RentalListAPIView, RentalDetailAPIView, BookReviewsList, BookAssessmentAPIView, \
+    BookExportAPIView, BookImportAPIView, TrendingBooksAPIView, BookRecommendationsAPIView, metrics_view
 
 urlpatterns = [
     # Books
     path('books/', BookCreateListAPIView.as_view(), name='books'),
     path('book/<int:pk>', BookDetailAPIView.as_view(), name='book'),
+    path('book/<int:pk>/recommendations', BookRecommendationsAPIView.as_view(), name='book-recommendations'),
+    path('books/export/', BookExportAPIView.as_view(), name='books-export'),
+    path('books/import/', BookImportAPIView.as_view(), name='books-import'),
+    path('books/trending/', TrendingBooksAPIView.as_view(), name='books-trending'),
 
     # genre
     path('genre/', GenreCreateListAPIView.as_view(), name='genre'),
@@ -35,5 +42,16 @@ urlpatterns = [
 
     # rating
     path('rating/<int:pk>', BookReviewsList.as_view(), name='rating'),
-    path('rating-add/', BookAssessmentAPIView.as_view(), name='rating-add')
+    path('rating-add/', BookAssessmentAPIView.as_view(), name='rating-add'),
+
+    # async (ASGI) read paths
+    path('async/books/', async_views.book_list, name='async-books'),
+    path('async/book/<int:pk>', async_views.book_detail, name='async-book'),
+    path('async/genre/', async_views.genre_list, name='async-genre'),
+    path('async/genre/<int:pk>', async_views.genre_books, name='async-genre-books'),
+    path('async/author/<int:pk>', async_views.author_books, name='async-author-books'),
+    path('async/search/', async_views.book_search, name='async-search'),
+
+    # monitoring
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -1,44 +1,199 @@
-import re
+from datetime import datetime
 
 from rest_framework import status
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView, RetrieveAPIView, CreateAPIView, \
     ListAPIView, RetrieveDestroyAPIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from django.core.cache import cache
-from django.db.models import Q
-
-from book.models import Book, Genre, Author, Basket, Assessment, Rental
-from book.permissions import IsAmin
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags
+
+from book import export, metrics, search
+from book.cache import get_or_compute, get_versions
+from book.importer import CatalogImporter, CatalogImportError, read_rows, text_stream
+from book.models import Book, BookRecommendation, Genre, Author, Basket, Assessment, Rental, RentalArchive, \
+    TrendingState
+from book.normalize import normalize_name
+from book.pagination import LatestCursorPagination, MergedLatestCursorPagination
+from book.permissions import IsAmin, IsAdminRole
+from book.renderers import ORJSONRenderer
 from book.serializer import BookSerializer, GenreSerializer, GenreBookSerializer, AuthorSerializer, \
-    AuthorBookSerializer, BasketSerializer, AssessmentSerializer, RentalSerializer, RentalCreateSerializer, \
-    RentalUpdateSerializer, RentalListSerializer, RentalDetailSerializer,BookReviewsSerializer
+    AuthorBookSerializer, BasketSerializer, AssessmentSerializer, RentalSerializer, \
+    RentalUpdateSerializer, RentalListSerializer, RentalDetailSerializer,BookReviewsSerializer, BookRowSerializer, \
+    RentalRowSerializer, BasketBatchSerializer
+
+
+class CatalogETagMixin:
+    # The ETag is built from the catalog version counters alone, so If-None-Match
+    # is answered with 304 before any query or serializer runs.
+    etag_models = ('book', 'author', 'genre')
+
+    def get(self, request, *args, **kwargs):
+        versions = '.'.join(str(version) for version in get_versions(*self.etag_models))
+        etag = f'"{self.__class__.__name__}-{versions}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().get(request, *args, **kwargs)
+        response['ETag'] = etag
+        patch_cache_control(response, **settings.CATALOG_CACHE_CONTROL)
+        # The body depends on who is asking (the endpoints require authentication).
+        patch_vary_headers(response, ('Authorization', 'Cookie'))
+        return response
 
 
 class BookCreateListAPIView(ListCreateAPIView):
-    queryset = Book.objects.all()
+    queryset = Book.objects.select_related('author', 'genre')
     permission_classes = [IsAuthenticated, IsAmin]
     serializer_class = BookSerializer
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
+    def list(self, request, *args, **kwargs):
+        rows = BookRowSerializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(BookRowSerializer(rows).data)
+        return self.get_paginated_response(BookRowSerializer(page).data)
 
-class BookDetailAPIView(RetrieveUpdateDestroyAPIView):
-    queryset = Book.objects.all()
+
+class BookDetailAPIView(CatalogETagMixin, RetrieveUpdateDestroyAPIView):
+    queryset = Book.objects.select_related('author', 'genre')
     permission_classes = [IsAuthenticated, IsAmin]
     serializer_class = BookSerializer
 
 
-class GenreCreateListAPIView(ListCreateAPIView):
+class TrendingBooksAPIView(ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = BookSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        try:
+            limit = min(int(self.request.query_params.get('limit', 10)), settings.TRENDING_MAX_LIMIT)
+        except ValueError:
+            limit = 10
+        return Book.objects.filter(trending_score__gt=0).select_related('author', 'genre') \
+            .order_by('-trending_score')[:max(limit, 1)]
+
+
+class BookRecommendationsAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, pk):
+        neighbors = BookRecommendation.objects.filter(book_id=pk).values_list('neighbors', flat=True).first()
+        if neighbors is None:
+            if not Book.objects.filter(pk=pk).exists():
+                raise Http404
+            neighbors = []
+        rows = {row['id']: row for row in BookRowSerializer.values(Book.objects.filter(pk__in=neighbors))} \
+            if neighbors else {}
+        # Deleted books drop out; the rest keep their rank.
+        return Response(BookRowSerializer([rows[book_id] for book_id in neighbors if book_id in rows]).data)
+
+
+class BookExportAPIView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminRole]
+    content_types = {
+        'ndjson': ('application/x-ndjson', export.ndjson_lines),
+        'csv': ('text/csv', export.csv_lines),
+    }
+
+    def get(self, request):
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type not in self.content_types:
+            return Response({"error": "type faqat 'ndjson' yoki 'csv' bo'lishi mumkin"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        books = Book.objects.order_by('id')
+        since = request.query_params.get('since')
+        if since:
+            try:
+                updated_since = parse_datetime(since) or parse_date(since)
+            except ValueError:
+                # Well formatted but impossible, e.g. 2024-02-30.
+                updated_since = None
+            if updated_since is None:
+                return Response({"error": "since ISO 8601 formatida bo'lishi kerak"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(updated_since, datetime):
+                updated_since = datetime.combine(updated_since, datetime.min.time())
+            if timezone.is_naive(updated_since):
+                updated_since = timezone.make_aware(updated_since)
+            books = books.filter(updated_at__gte=updated_since)
+
+        rows = books.values_list(
+            'id', 'name', 'description', 'author__name', 'genre__name', 'daily_price', 'available_copies',
+            'is_available', 'updated_at',
+        ).iterator(chunk_size=settings.BOOK_EXPORT_CHUNK_SIZE)
+
+        content_type, render = self.content_types[export_type]
+        response = StreamingHttpResponse(render(export.measured(rows)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="books.{export_type}"'
+        return response
+
+
+class BookImportAPIView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminRole]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Fayl yuklanmadi (file)."}, status=status.HTTP_400_BAD_REQUEST)
+
+        import_type = request.data.get('type') or upload.name.rsplit('.', 1)[-1].lower()
+        if import_type not in ('csv', 'jsonl'):
+            return Response({"error": "type faqat 'csv' yoki 'jsonl' bo'lishi mumkin"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        skip = str(request.data.get('skip') or 0)
+        if not skip.isdecimal():
+            return Response({"error": "skip manfiy bo'lmagan butun son bo'lishi kerak"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            stats = CatalogImporter().run(read_rows(text_stream(upload.file), import_type), skip=int(skip))
+        except CatalogImportError as exc:
+            return Response({"error": str(exc), "resume_from": exc.resume_from},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(stats, status=status.HTTP_201_CREATED)
+
+
+class GenreCreateListAPIView(CatalogETagMixin, ListCreateAPIView):
     queryset = Genre.objects.all()
     permission_classes = [IsAuthenticated, IsAmin]
     serializer_class = GenreSerializer
+    etag_models = ('genre',)
+
+
+class PaginatedBooksMixin:
+    book_filter = None
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        books = Book.objects.filter(**{self.book_filter: instance}).select_related('author', 'genre')
+        paginator = self.paginator
+        page = paginator.paginate_queryset(books, request, view=self)
+        serializer = self.get_serializer_class()(instance, context={**self.get_serializer_context(), 'books': page})
+        return Response({**serializer.data, 'next': paginator.get_next_link(),
+                         'previous': paginator.get_previous_link()})
 
-class GenreBooksListAPIView(RetrieveAPIView):
+
+class GenreBooksListAPIView(CatalogETagMixin, PaginatedBooksMixin, RetrieveAPIView):
     queryset = Genre.objects.all()
     serializer_class = GenreBookSerializer
     permission_classes = [IsAuthenticated]
+    book_filter = 'genre'
 
 
 class AuthorCreateListAPIVew(ListCreateAPIView):
@@ -47,21 +202,38 @@ class AuthorCreateListAPIVew(ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsAmin]
 
 
-class AuthorBooksListAPIView(RetrieveAPIView):
+class AuthorBooksListAPIView(CatalogETagMixin, PaginatedBooksMixin, RetrieveAPIView):
     queryset = Author.objects.all()
     serializer_class = AuthorBookSerializer
     permission_classes = [IsAuthenticated]
+    book_filter = 'author'
 
 
 class BasketCreateListAPIView(ListCreateAPIView):
     serializer_class = BasketSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = LatestCursorPagination
 
     def get_queryset(self):
         return Basket.objects.filter(user=self.request.user)
 
+    def create(self, request, *args, **kwargs):
+        # {"books": [1, 2, 3]} adds a batch; {"book": 1} is still accepted.
+        if 'books' not in request.data:
+            return super().create(request, *args, **kwargs)
+        serializer = BasketBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = Basket.add_books(request.user, serializer.validated_data['books'])
+        added = any(result['status'] == 'added' for result in results)
+        return Response({'results': results}, status=status.HTTP_201_CREATED if added else status.HTTP_200_OK)
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # The (user, book) unique constraint rejects duplicates, even between concurrent requests.
+        try:
+            with transaction.atomic():
+                serializer.save(user=self.request.user)
+        except IntegrityError:
+            raise ValidationError("Siz bu kitobni allaqachon savatchaga qo'shgansiz.")
 
 
 class BookAssessmentAPIView(CreateAPIView):
@@ -102,14 +274,17 @@ class BookAssessmentAPIView(CreateAPIView):
 
 
 class BookReviewsList(ListAPIView):
-    queryset = Assessment.objects.all()
     permission_classes = [IsAuthenticated]
     serializer_class = BookReviewsSerializer
 
+    def get_queryset(self):
+        return Assessment.objects.filter(book_id=self.kwargs['pk']).select_related('book')
+
 
 # --------------------------------------------------------------------------------------------------------------- #
 class RentalCreateListAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -117,9 +292,15 @@ class RentalCreateListAPIView(APIView):
                 "error": "Foydalanuvchi autentifikatsiyadan o'tmagan"
             }, status=status.HTTP_401_UNAUTHORIZED)
 
-        rentals = Rental.objects.filter(user=request.user).all()
-        serializer = RentalSerializer(rentals, many=True)
-        return Response({"books": serializer.data}, status=status.HTTP_200_OK)
+        # Closed rentals older than RENTAL_ARCHIVE_AFTER_DAYS live in RentalArchive; the history shows both.
+        paginator = MergedLatestCursorPagination()
+        page = paginator.paginate_querysets([
+            RentalRowSerializer.values(Rental.objects.filter(user=request.user)),
+            RentalRowSerializer.values(RentalArchive.objects.filter(user=request.user)),
+        ], request, view=self)
+        serializer = RentalRowSerializer(page)
+        return Response({"books": serializer.data, "next": paginator.get_next_link(),
+                         "previous": paginator.get_previous_link()}, status=status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
         user = request.user
@@ -129,25 +310,36 @@ class RentalCreateListAPIView(APIView):
             }, status=status.HTTP_401_UNAUTHORIZED)
 
         # Basketdagi barcha kitoblarni olish
-        basket_items = Basket.objects.filter(user=user).all()
-        if not basket_items.exists():
+        basket_items = Basket.objects.filter(user=user).select_related('book')
+        books = [item.book for item in basket_items]
+        if not books:
             return Response({
                 "error": "Savat bo'sh."
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        rentals = []
-        for item in basket_items:
-            serializer = RentalCreateSerializer(data={"book": item.book.id}, context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            rental = serializer.save(user=user)
-            rentals.append(rental)
+        if Rental.calculate_user_debt(user) > 0:
+            return Response({
+                "error": "Sizda qarzdorlik bo'lgani uchun kitob bron qilolmaysiz."
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Savatni tozalash
-        basket_items.delete()
+        try:
+            with Rental.reserving():
+                rentals, errors = Rental.reserve(user, books)
+                TrendingState.record(rental.book_id for rental in rentals)
+                # Savatdan faqat bron qilingan kitoblarni olib tashlash
+                Basket.objects.filter(user=user, book_id__in=[rental.book_id for rental in rentals]).delete()
+        except IntegrityError:
+            # Parallel so'rov shu kitoblardan birini bron qilib ulgurdi (rental_one_active_per_book)
+            return Response({"error": "Savatdagi kitoblardan biri allaqachon sizda ijarada."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if not rentals:
+            return Response({"error": "Hech bir kitob bron qilinmadi.", "errors": errors},
+                            status=status.HTTP_400_BAD_REQUEST)
 
         response_serializer = RentalSerializer(rentals, many=True)
-        return Response({"message": "Savatdagi kitoblar bron qilindi.", "rentals": response_serializer.data},
-                        status=status.HTTP_201_CREATED)
+        return Response({"message": "Savatdagi kitoblar bron qilindi.", "rentals": response_serializer.data,
+                         "errors": errors}, status=status.HTTP_201_CREATED)
 
 
 class RentalUpdateAPIView(APIView):
@@ -183,9 +375,10 @@ class RentalUpdateAPIView(APIView):
 class RentalListAPIView(ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = RentalListSerializer
+    pagination_class = LatestCursorPagination
 
     def get_queryset(self):
-        return Rental.objects.filter(user=self.request.user, status__in=['bron', 'ijara'])
+        return Rental.objects.filter(user=self.request.user, status__in=['bron', 'ijara']).select_related('book')
 
 
 class RentalDetailAPIView(RetrieveDestroyAPIView):
@@ -193,43 +386,45 @@ class RentalDetailAPIView(RetrieveDestroyAPIView):
     serializer_class = RentalDetailSerializer
 
     def get_queryset(self):
-        return Rental.objects.filter(user=self.request.user, status__in=['bron', 'ijara'])
+        return Rental.objects.filter(user=self.request.user, status__in=['bron', 'ijara']).select_related('book')
 
     def perform_destroy(self, instance):
         if instance.status == 'bron':
             instance.status = 'bekor'
-            instance.book.available_copies += 1
-            instance.book.save()
-            instance.save()
+            with transaction.atomic():
+                Book.restore_copies({instance.book_id: 1})
+                instance.save()
             return Response({'detail': 'Bron bekor qilindi.'}, status=status.HTTP_204_NO_CONTENT)
         return Response({'detail': 'Faqat bron qilingan kitobni o‘chirish mumkin.'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-def clean_query(query):
-    query = query.replace("'", "")
-    query = re.sub(r"[^a-zA-Z0-9\s]", "", query)
-    return query.strip().lower()
-
-
 class SearchAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def search_books(self, cleaned_query):
+        if search.is_enabled():
+            book_ids = search.search_book_ids(cleaned_query)
+            ranks = {book_id: rank for rank, book_id in enumerate(book_ids)}
+            books = sorted(BookRowSerializer.values(Book.objects.filter(pk__in=book_ids)),
+                           key=lambda book: ranks[book['id']])
+        else:
+            books = BookRowSerializer.values(
+                Book.objects.filter(search.fallback_filter(cleaned_query)).order_by('id')
+            )
+        return BookRowSerializer(books).data
 
     def perform_search(self, query):
-        cleaned_query = clean_query(query)
-        cache_key = f"book_search_{cleaned_query}"
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return cached_data
-
-        books = Book.objects.filter(
-            Q(cleaned_name__icontains=cleaned_query) |
-            Q(author__cleaned_name__icontains=cleaned_query) |
-            Q(genre__cleaned_name__icontains=cleaned_query)
+        cleaned_query = normalize_name(query)
+        book_version, author_version, genre_version = get_versions('book', 'author', 'genre')
+        cache_key = f"book_search_{book_version}.{author_version}.{genre_version}_{cleaned_query}"
+        return get_or_compute(
+            cache_key,
+            lambda: self.search_books(cleaned_query),
+            timeout=settings.BOOK_SEARCH_CACHE_TTL,
+            empty_timeout=settings.BOOK_SEARCH_EMPTY_CACHE_TTL,
+            counter='book_search',
         )
-        serializer = BookSerializer(books, many=True)
-        cache.set(cache_key, serializer.data, timeout=300)
-        return serializer.data
 
     def get(self, request):
         query = request.query_params.get("search", None)
@@ -246,3 +441,9 @@ class SearchAPIView(APIView):
 
         result = self.perform_search(query)
         return Response(result, status=status.HTTP_200_OK)
+
+
+def metrics_view(request):
+    if not settings.PERFORMANCE_METRICS:
+        raise Http404
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4')
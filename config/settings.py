@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'book.middleware.PerformanceMiddleware',
+    'book.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +72,8 @@ TEMPLATES = [
     },
 ]
 AUTH_USER_MODEL = 'book.User'
+AUTHENTICATION_BACKENDS = ['book.authentication.CachedModelBackend']
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
@@ -82,6 +86,19 @@ DATABASES = {
     }
 }
 
+# O'qish uchun replikalar: DATABASE_REPLICA_URLS=sqlite:////path/replica.sqlite3,postgres://...
+# Xavfsiz (GET/HEAD/OPTIONS) so'rovlar replikadan o'qiladi, yozgan mijoz esa
+# READ_YOUR_WRITES_SECONDS davomida asosiy bazadan o'qiydi.
+DATABASE_REPLICAS = []
+for index, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[])):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = env.db_url_config(url)
+    DATABASES[alias]['TEST'] = {'NAME': f'test_{alias}'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['book.routers.PrimaryReplicaRouter']
+READ_YOUR_WRITES_SECONDS = env.int('READ_YOUR_WRITES_SECONDS', default=5)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -126,6 +143,54 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_TIMEZONE = 'UTC'
 
+# Muddati o'tgan bronlar navbati (Rental.expires_at) shu oraliqda (soniya) tekshiriladi
+RESERVATION_EXPIRY_POLL_SECONDS = env.int('RESERVATION_EXPIRY_POLL_SECONDS', default=60)
+
+# Ommabop kitoblar zaxirasi Redis hisoblagichlarida (book.inventory): o'zgarishlar bazaga
+# HOT_INVENTORY_FLUSH_SECONDS da bir marta yoziladi, hisoblagichlar esa bazadan qayta tekshiriladi
+HOT_INVENTORY_REDIS_URL = env('HOT_INVENTORY_REDIS_URL', default='redis://127.0.0.1:6379/2')
+HOT_INVENTORY_FLUSH_SECONDS = env.int('HOT_INVENTORY_FLUSH_SECONDS', default=5)
+HOT_INVENTORY_RECONCILE_SECONDS = env.int('HOT_INVENTORY_RECONCILE_SECONDS', default=60)
+
+# Shuncha kundan oldin yopilgan (qaytarilgan/bekor) ijaralar RentalArchive jadvaliga ko'chiriladi
+RENTAL_ARCHIVE_AFTER_DAYS = env.int('RENTAL_ARCHIVE_AFTER_DAYS', default=90)
+
+# "Shu kitobni olganlar yana nimalarni olgan" tavsiyalari: co-rental matritsasi faylda saqlanadi va
+# RECOMMENDATIONS_REBUILD_SECONDS da bir marta faqat yangi ijaralar bilan yangilanadi
+RECOMMENDATIONS_MATRIX_PATH = env('RECOMMENDATIONS_MATRIX_PATH', default=str(BASE_DIR / 'corental.npz'))
+RECOMMENDATIONS_REBUILD_SECONDS = env.int('RECOMMENDATIONS_REBUILD_SECONDS', default=60 * 60)
+RECOMMENDATIONS_TOP_K = 20
+# Har bir o'quvchining faqat oxirgi shuncha kitobi hisobga olinadi
+RECOMMENDATIONS_USER_HISTORY = 200
+
+CELERY_BEAT_SCHEDULE = {
+    'expire-reservations': {
+        'task': 'book.tasks.cancel_bron_if_not_collected',
+        'schedule': RESERVATION_EXPIRY_POLL_SECONDS,
+    },
+    'flush-hot-inventory': {
+        'task': 'book.tasks.flush_hot_inventory',
+        'schedule': HOT_INVENTORY_FLUSH_SECONDS,
+    },
+    'reconcile-hot-inventory': {
+        'task': 'book.tasks.reconcile_hot_inventory',
+        'schedule': HOT_INVENTORY_RECONCILE_SECONDS,
+    },
+    'archive-rentals': {
+        'task': 'book.tasks.archive_closed_rentals',
+        'schedule': 24 * 60 * 60,
+    },
+    'rebuild-recommendations': {
+        'task': 'book.tasks.rebuild_recommendations',
+        'schedule': RECOMMENDATIONS_REBUILD_SECONDS,
+    },
+    # Trend og'irliklari epoch'dan beri o'sib boradi; har kuni epoch oldinga suriladi
+    'renormalize-trending-scores': {
+        'task': 'book.tasks.renormalize_trending_scores',
+        'schedule': 24 * 60 * 60,
+    },
+}
+
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
@@ -136,12 +201,47 @@ CACHES = {
     }
 }
 
+# So'rovlar bo'yicha SQL/kesh/render vaqtini o'lchash (Server-Timing sarlavhasi va /metrics)
+PERFORMANCE_METRICS = env.bool('PERFORMANCE_METRICS', default=False)
+
+# Kitob qidiruvi: SQLite bazasida FTS5 indeksidan foydalaniladi
+BOOK_SEARCH_FTS = env.bool('BOOK_SEARCH_FTS', default=True)
+BOOK_SEARCH_LIMIT = 100
+# Kesh kalitlari katalog versiyalariga bog'langan, shuning uchun TTL uzoq bo'lishi mumkin
+BOOK_SEARCH_CACHE_TTL = 60 * 60
+BOOK_SEARCH_EMPTY_CACHE_TTL = 60
+
+# Katalog endpointlari uchun Cache-Control: javoblar faqat autentifikatsiyadan o'tganlarga beriladi, shuning
+# uchun umumiy keshlar (CDN) saqlamaydi; brauzer esa har safar ETag bilan tekshiradi (304)
+CATALOG_CACHE_CONTROL = {'private': True, 'max_age': 0, 'must_revalidate': True}
+
+# Katalog eksporti server tomonidagi kursordan shu o'lchamdagi bo'laklarda o'qiladi
+BOOK_EXPORT_CHUNK_SIZE = 2000
+
+# Trend reytingi: ijaralar soni har TRENDING_HALF_LIFE_HOURS soatda ikki barobar kamayadi
+TRENDING_HALF_LIFE_HOURS = 72
+TRENDING_MAX_LIMIT = 100
+
+# Bir xil kesh qiymatini qayta hisoblashda ishlatiladigan qisqa Redis lock (soniya)
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_WAIT = 2
+
+# Token/sessiya foydalanuvchisi keshi: Redis (soniya) va har bir jarayondagi LRU
+AUTH_CACHE_TTL = 300
+AUTH_LOCAL_CACHE_TTL = 5
+AUTH_LOCAL_CACHE_SIZE = 10000
+
+# Savatchaga bitta so'rovda qo'shish mumkin bo'lgan kitoblar soni
+BASKET_BATCH_LIMIT = 100
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'book.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'book.pagination.IdCursorPagination',
+    'PAGE_SIZE': 50,
 
 }